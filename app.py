@@ -7,116 +7,109 @@ TODO
 """
 
 import duckdb
+import hmac
+import os
 import requests
 import polars as pl
 import streamlit as st
-import time
 from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from utils.db import db_generation, get_pool
+from utils.history import PriceHistory
+from utils.icons import icon_url
+from utils.metrics import METRICS, start_metrics_server
+from utils.search import RecipeSearchIndex
+from utils.snapshot import read_snapshot
+from utils.utils import add_selectbox_label
+from utils.planner import plan_shopping
+from utils.profiler import SamplingProfiler
+from utils.prefetch import PopularityTracker, Prefetcher, build_recipe_item_map
+from utils.universalis import PriceCache, get_market_prices, make_requests_session
+from utils.watchlist import OwnerLock, Watchlist, WatchlistStore
 
 ### Configuration variables
 DB_NAME = "ffxiv_price.duckdb"
+PROFIT_DB_NAME = "profit_scan.duckdb"  # Written by profit_scan.py
 home_page = st.Page("app.py", default=True)
 default_profit_goal = 0.25  # Minimum profit % to show "good profit" message
 default_velocity_warning = 15  # Minimum velocity to show "good sell" message
 default_velocity_goal = 40  # Minimum velocity to show "good sell" message
+history_ranges = {"24 hours": timedelta(days=1), "7 days": timedelta(days=7), "30 days": timedelta(days=30), "1 year": timedelta(days=365)}
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9464))  # Port serving /metrics (Prometheus) and /metrics.json
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Interface the unauthenticated metrics endpoint binds to
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")  # Admin token required for ?profile=1; profiling is disabled if unset
+WATCHLIST_TOKEN = os.getenv("WATCHLIST_TOKEN")  # Admin token required to view and edit watch rules; the panel is disabled if unset
+
+
+# Cached frames are keyed by database generation so a swapped-in rebuild is picked up without a restart;
+# max_entries=1 releases the previous generation
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_worlds_dc(generation: int = 0) -> pl.DataFrame:
+    # Memory-map world & dc snapshot written by update_db, falling back to local duckdb
+    with METRICS.span("db_load", table="world_dc") as span:
+        df = read_snapshot("world_dc")
+        span["source"] = "snapshot"
+        if df is None:
+            with duckdb.connect(DB_NAME, read_only=True) as con:
+                query = """SELECT * from  world_dc"""
+                df = con.sql(query).pl()
+            span["source"] = "duckdb"
+        span["rows"] = len(df)
+    return df
 
 
-@st.cache_resource(show_spinner=False)
-def get_worlds_dc() -> pl.DataFrame:
-    # Read world & dc data from local duckdb
-    with duckdb.connect(DB_NAME) as con:
-        query = """SELECT * from  world_dc"""
-        df = con.sql(query).pl()
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_all_recipes(generation: int = 0) -> pl.DataFrame:
+    # Memory-map recipe snapshot written by update_db (selectbox labels already included), falling back to local duckdb
+    with METRICS.span("db_load", table="recipe_price") as span:
+        df = read_snapshot("recipe_price")
+        span["source"] = "snapshot"
+        if df is None:
+            with duckdb.connect(DB_NAME, read_only=True) as con:
+                query = """SELECT * from  recipe_price"""
+                df = add_selectbox_label(con.sql(query).pl())
+            span["source"] = "duckdb"
+        span["rows"] = len(df)
     return df
 
 
-@st.cache_resource(show_spinner=False)
-def get_all_recipes() -> pl.DataFrame:
-    # Read recipe data from local duckdb
-    with duckdb.connect(DB_NAME) as con:
-        query = """SELECT * from  recipe_price"""
-        df = con.sql(query).pl()
-    results_df = df.filter(pl.col("recipe_part") == "result")
-
-    # Concat item_id to the end of item_name to make selectbox easily searchable
-    # Some items can be crafted by two jobs (ARM/BSM) with slightly different recipes, so appending job name to the end as well
-    two_job_craftable = results_df.filter(pl.col("item_id").is_duplicated())
-
-    df = df.lazy().with_columns(
-        pl.when(pl.col("recipe_id").is_in(two_job_craftable["recipe_id"].implode()))
-        .then(pl.concat_str([pl.col("item_name"), pl.lit(" ("), pl.col("item_id"), pl.lit(")"), pl.lit(" ("), pl.col("job"), pl.lit(")")]))
-        .otherwise(pl.concat_str([pl.col("item_name"), pl.lit(" ("), pl.col("item_id"), pl.lit(")")]))
-        .alias("selectbox_label")
-    ).collect()
-
-    return df
+@st.cache_data(show_spinner=False, ttl=600)
+def get_top_profits(market: str, min_velocity: float, generation: int, limit: int = 25) -> pl.DataFrame | None:
+    # Read precomputed rankings from the latest profit scan; None if no scan has run yet
+    if not generation:
+        return None
+    with METRICS.span("db_load", table="profit_scan"), duckdb.connect(PROFIT_DB_NAME, read_only=True) as con:
+        query = """SELECT * FROM profit_scan WHERE lower(market) = lower(?) AND velocity >= ? ORDER BY rank LIMIT ?"""
+        df = con.execute(query, [market, min_velocity, limit]).pl()
+    # subcraft_cost: cost when craftable ingredients are crafted where cheaper (absent from older scans)
+    columns = ["rank", "item_name", "item_id", "job", "craft_cost", "subcraft_cost", "sell_price", "profit", "profit_perc", "velocity", "scanned_at"]
+    return df.select(column for column in columns if column in df.columns)
 
 
-@st.cache_data(show_spinner=False, show_time=True)
+@st.cache_data(show_spinner=False, show_time=True, ttl=60)
 def get_prices_from_universalis(lookup_items_df: pl.DataFrame, region: str) -> pl.DataFrame:
     ## Get market price data from universalis API
     
-    # Prepare API call with parameters
-    lookup_item_ids  =  [
-        str(id) for id in lookup_items_df["item_id"]]
-    url = f"https://universalis.app/api/v2/{region}/{','.join(lookup_item_ids)}"
-
-    # GET data from Universalis API twice per item - once each for NQ/HQ
-    raw_market_data = {}
-    for hq in [False, True]:
-        parameters = {
-            "hq": hq,
-            "listings": 100,
-            "fields": "items.nqSaleVelocity,items.hqSaleVelocity,items.listings.pricePerUnit,items.listings.onMannequin,items.listings.worldName",
-        }
-        
-        # Use shared requests session with retries/backoff
-        session = get_requests_session()
-        try:
-            response_json = fetch_universalis(session, url, parameters)
-        except Exception:
-            st.error("No response from Universalis.app - please try again")
-            st.stop()
-
-        # Unpivot and unnest json data
-        data = response_json["items"]
-        df = pl.DataFrame(data).lazy().unpivot(variable_name="id").unnest("value")
-        df = df.explode("listings").unnest("listings")
+    # Only runs on a Streamlit cache miss; shared price cache hits/misses are counted in utils.universalis
+    METRICS.inc("price_data_cache_misses_total")
 
-        # Filter out Mannquin items (irrelevant listings)
-        df = df.filter(
-            (pl.col("onMannequin") == False) | pl.col("onMannequin").is_null()
-        )
-        
-        # Add worldname if missing (for single world queries)
-        if region in world_list:
-            df = df.with_columns((pl.lit(region)).alias("worldName"))
+    # Market data is shared across sessions via the price cache; only stale/missing items are fetched
+    session = get_requests_session()
+    try:
+        prices_df = get_market_prices(session, get_price_cache(), lookup_items_df["item_id"], region)
+    except Exception:
+        st.error("No response from Universalis.app - please try again")
+        st.stop()
 
-        # Find minimum price for each group, then merge NQ/HQ data together
 
-        df = df.group_by("id").min()
-        
-        if hq:
-            hq_df = df.select(
-                pl.col("id"),
-                pl.col("pricePerUnit").alias("hq_price"),
-                pl.col("hqSaleVelocity").round(2).alias("hq_velocity"),
-                pl.col("worldName").alias("hq_world")
-            )
-        elif not hq:
-            nq_df = df.select(
-                pl.col("id"),
-                pl.col("pricePerUnit").alias("nq_price"),
-                pl.col("nqSaleVelocity").round(2).alias("nq_velocity"),
-                pl.col("worldName").alias("nq_world")
-            )
-        
-
-    prices_df = nq_df.join(hq_df, on="id").sort("id").rename({"id":"item_id"})
-    prices_df = prices_df.with_columns(pl.col("item_id").cast(pl.Int64)).collect()
+    # Join data from universalis lookup onto exist data from local duckdb
+    with METRICS.span("price_pipeline", region=region):
+        df = join_prices(lookup_items_df, prices_df)
+    return df
 
 
-    # Join data from universalis lookup onto exist data from local duckdb
+def join_prices(lookup_items_df: pl.DataFrame, prices_df: pl.DataFrame) -> pl.DataFrame:
+    # Join market rows onto recipe rows and find the cheapest source for each item
     df = lookup_items_df.lazy().join(prices_df.lazy(), on="item_id", how="left")
     df = df.with_columns(pl.min_horizontal("shop_price", "nq_price", "hq_price").alias("cheapest"))
 
@@ -137,24 +130,87 @@ def get_prices_from_universalis(lookup_items_df: pl.DataFrame, region: str) -> p
 
 @st.cache_resource(show_spinner=False)
 def get_requests_session() -> requests.Session:
-    session = requests.Session()
+    return make_requests_session()
+
+
+@st.cache_resource(show_spinner=False)
+def get_price_cache() -> PriceCache:
+    # Every fetch, from pages or the prefetcher, is also recorded in the price history
+    cache = PriceCache()
+    cache.listeners.append(get_price_history().record)
+    return cache
+
+
+@st.cache_resource(show_spinner=False)
+def get_price_history() -> PriceHistory:
+    # Pages only buffer observations; its own thread writes and compacts them
+    return PriceHistory().start()
+
+
+@st.cache_data(show_spinner=False, ttl=60)
+def get_price_history_df(item_id: int, region: str, range_label: str, hq: bool) -> pl.DataFrame | None:
+    # Bars for the history chart, read from the history's read-only snapshot; None if it is unreadable
+    start = datetime.now(timezone.utc) - history_ranges[range_label]
     try:
-        from urllib3.util import Retry
-        from requests.adapters import HTTPAdapter
-        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
-        adapter = HTTPAdapter(max_retries=retries)
-        session.mount("https://", adapter)
-        session.mount("http://", adapter)
-    except Exception:
-        pass
-    return session
+        with METRICS.span("db_load", table="price_history"):
+            return get_price_history().history(item_id, region, start, hq=hq)
+    except (duckdb.Error, RuntimeError, TimeoutError):
+        return None
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_search_index(generation: int = 0) -> RecipeSearchIndex:
+    # Built once per process (and database generation) from the recipe table
+    return RecipeSearchIndex(get_all_recipes(generation))
 
 
-def fetch_universalis(session: requests.Session, url: str, params: dict) -> dict:
-    resp = session.get(url, params=params, timeout=10)
-    resp.raise_for_status()
-    time.sleep(0.2)
-    return resp.json()
+@st.cache_resource(show_spinner=False)
+def get_metrics_server():
+    # One metrics endpoint per process; page reruns reuse it
+    return start_metrics_server(METRICS_PORT, host=METRICS_HOST)
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_recipe_item_map(generation: int = 0) -> dict[int, list[int]]:
+    return build_recipe_item_map(get_all_recipes(generation))
+
+
+@st.cache_resource(show_spinner=False)
+def get_prefetcher() -> Prefetcher:
+    # Background worker keeping prices for the most requested recipes and watched rules warm in the
+    # shared price cache; its recipe map and watchlist are refreshed on each run to follow database generations
+    generation = db_generation(DB_NAME)
+    try:
+        watchlist = get_watchlist(generation)
+    except duckdb.Error:
+        watchlist = None  # Watchlist file busy; attached by a later page run
+    return Prefetcher(PopularityTracker(), get_price_cache(), get_recipe_item_map(generation),
+                      session_factory=get_requests_session, watchlist=watchlist).start()
+
+
+@st.cache_resource(show_spinner=False)
+def get_watchlist_store() -> WatchlistStore:
+    # Writable store of watch rules, kept apart from the swapped-in price database
+    return WatchlistStore()
+
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_watchlist(generation: int = 0) -> Watchlist:
+    # Evaluated by the prefetcher as it refreshes prices, in whichever worker holds the owner lock;
+    # rebuilt per database generation
+    return Watchlist(get_watchlist_store(), get_all_recipes(generation), owner=get_watchlist_owner())
+
+
+@st.cache_data(show_spinner=False, ttl=30)
+def get_watch_rules_df() -> pl.DataFrame:
+    # Cached, so page runs don't each take the watchlist file's write lock; cleared on edits
+    return get_watchlist_store().rules_df()
+
+
+@st.cache_resource(show_spinner=False)
+def get_watchlist_owner() -> OwnerLock:
+    # One lock per process, shared by every generation's watchlist
+    return OwnerLock()
 
 
 def format_gil(price: int | float) -> str:
@@ -196,6 +252,7 @@ def extract_Item_from_df(df: pl.DataFrame, index: int) -> Item:
     return Item(name, item_id, amount, shop_price, nq_price, nq_velocity, nq_world, hq_price, hq_velocity, hq_world, cheapest, icon_url)
 
 @st.fragment
+@METRICS.timed("render", function="print_result")
 def print_result(buy_result_df: pl.DataFrame, sell_result_df: pl.DataFrame, craft_cost_total: int) -> int:
 
     # Extract fields using helper dataclasses
@@ -268,6 +325,32 @@ def print_result(buy_result_df: pl.DataFrame, sell_result_df: pl.DataFrame, craf
                                     price_each=buy_price_each)
     with result_grid[(row, 2)]:
         buy_recommend(profit_perc)
+
+    print_price_history(id, st.session_state.get("world") or st.session_state.dc, hq=type == "HQ")
+
+
+@st.fragment
+def print_price_history(item_id: int, region: str, hq: bool):
+    ## Chart recorded sell prices for the result item; finer ranges use finer bars (see utils.history)
+    st.markdown(f"#### Price history on {region}")
+    range_label = st.segmented_control("History range", list(history_ranges), default="7 days", key="history_range")
+    history_df = get_price_history_df(item_id, region, range_label or "7 days", hq)
+    if history_df is None:
+        st.write("Price history is unavailable right now.")
+        return
+    if history_df.is_empty():
+        st.write("No price history recorded yet.")
+        return
+    # Vega-Lite spec passed directly; st.line_chart builds it through Altair, which is far slower per render
+    x = {"field": "bucket", "type": "temporal", "title": None}
+    st.vega_lite_chart(history_df, {
+        "layer": [
+            {"mark": {"type": "area", "opacity": 0.3},
+             "encoding": {"x": x, "y": {"field": "low", "type": "quantitative", "title": "Price per unit (low-high, close)"},
+                          "y2": {"field": "high"}}},
+            {"mark": {"type": "line", "point": True}, "encoding": {"x": x, "y": {"field": "close", "type": "quantitative"}}},
+        ],
+    })
     
 
 
@@ -363,6 +446,7 @@ def buy_recommend(profit_perc):
         st.success(f"&nbsp; Profit above {st.session_state.get("profit_goal"):,.0%}: {profit_perc:,.2%}", icon="🥳")
 
 @st.fragment
+@METRICS.timed("render", function="print_ingredients")
 def print_ingredients(buy_price_df: pl.DataFrame, sell_price_df: pl.DataFrame):
     ## List ingredient data in a grid for clarity
     
@@ -513,13 +597,99 @@ def print_ingr_amount_input(id: int, source: str,  amount: int, price: int, defa
         
 
 
-def make_icon_url(icon: int) -> str:
-    # GET icon image from XIVAPI using icon ID
-    folder = f"{icon:0>6}"
-    folder = folder[:3] + "000"
-    icon_url = f"https://v2.xivapi.com/api/asset?path=ui/icon/{folder}/{icon:0>6}.tex&format=png"
+@st.fragment
+def print_shopping_planner():
+    ## Aggregate ingredients across many crafts and assign purchases to the cheapest worlds
+    st.text(
+        "Add item IDs and how many of each you want; ingredient demand is totalled across all crafts "
+        "and bought from the cheapest listings (whole listings) or vendors."
+    )
+    default_targets = [{"item_id": int(st.session_state.item), "quantity": 1}] if st.session_state.get("item") else []
+    targets_df = st.data_editor(
+        pl.DataFrame(default_targets, schema={"item_id": pl.Int64, "quantity": pl.Int64}),
+        num_rows="dynamic",
+        key="planner_targets",
+    )
+    if not st.button("Plan purchases"):
+        return
+
+    # Map item IDs onto recipes (first recipe if craftable by two jobs)
+    targets_df = pl.DataFrame(targets_df).drop_nulls().filter(pl.col("quantity") > 0)
+    targets_df = targets_df.join(
+        results_df.select("item_id", "recipe_id").unique("item_id", keep="first"), on="item_id", how="left"
+    )
+    unknown = targets_df.filter(pl.col("recipe_id").is_null())["item_id"].to_list()
+    if unknown:
+        st.warning(f"Not craftable, skipped: {', '.join(str(id) for id in unknown)}")
+    targets = targets_df.drop_nulls().select("recipe_id", "quantity").rows()
+
+    region = st.session_state.world if st.session_state.get("same_world_buy") else st.session_state.dc
+    with st.spinner("Fetching listings from Universalis"):
+        try:
+            plan = plan_shopping(get_requests_session(), all_recipes_df, targets, region)
+        except Exception:
+            st.error("No response from Universalis.app - please try again")
+            return
+
+    names_df = all_recipes_df.select("item_id", "item_name").unique("item_id")
+    st.metric("Total cost", format_gil(plan.total_cost))
+    for world, cost in plan.by_world().select("world", "cost").rows():
+        st.markdown(f"#### {world}: {format_gil(cost)}")
+        world_df = plan.purchases.filter(pl.col("world") == world).join(names_df, on="item_id", how="left")
+        st.dataframe(world_df.select("item_name", "item_id", "hq", "quantity", "price_per_unit", "cost"), hide_index=True)
+    if not plan.shortfall.is_empty():
+        shortfall_df = plan.shortfall.join(names_df, on="item_id", how="left")
+        st.warning("Not enough listings for: " + ", ".join(f"{name} (x{missing})" for name, missing in shortfall_df.select("item_name", "missing").rows()))
+
+
+@st.fragment
+def print_watchlist():
+    ## Rules alerting (to the alert log/webhook) when a recipe crosses the profit & velocity goals
+    if not WATCHLIST_TOKEN:
+        st.write("The watchlist is disabled on this deployment.")
+        return
+    # Rules are shared by every visitor, so viewing and editing them is admin-only
+    token = st.text_input("Admin token", type="password", key="watchlist_token")
+    if not token or not hmac.compare_digest(token.encode(), WATCHLIST_TOKEN.encode()):
+        st.write("Enter the admin token to view and edit watched recipes.")
+        return
+    st.text(
+        "Watched recipes are checked in the background when added and whenever their ingredient or result prices change. "
+        "An alert is sent when a recipe starts or stops meeting its goals."
+    )
+    store = get_watchlist_store()
+    try:
+        if st.session_state.get("item"):
+            recipe_id = results_df.filter(pl.col("item_id") == int(st.session_state.item))["recipe_id"].first()
+            market = " / ".join(filter(None, (st.session_state.dc, st.session_state.get("world"))))
+            if recipe_id is not None and st.button(f"Watch this recipe on {market} with current goals"):
+                store.add_rule(recipe_id, st.session_state.dc, st.session_state.get("world"),
+                               st.session_state.profit_goal, st.session_state.velocity_goal)
+                get_watch_rules_df.clear()
+
+        rules_df = get_watch_rules_df()
+        if rules_df.is_empty():
+            st.write("No watched recipes yet.")
+            return
+        names_df = results_df.select("recipe_id", "item_name").unique("recipe_id")
+        st.dataframe(
+            rules_df.join(names_df, on="recipe_id", how="left").select(
+                "rule_id", "item_name", "dc", "world", "profit_goal", "velocity_goal",
+                pl.col("last_state").alias("goals_met"), "last_profit_perc", "last_velocity", "last_evaluated_at"),
+            hide_index=True)
+        remove_id = st.selectbox("Remove rule", rules_df["rule_id"], index=None)
+        if remove_id is not None and st.button("Remove"):
+            store.remove_rule(remove_id)
+            get_watch_rules_df.clear()
+            st.rerun(scope="fragment")
+    except duckdb.Error:
+        # Another worker holds the watchlist file's write lock
+        st.write("The watchlist is busy right now; please try again.")
 
-    return icon_url
+
+def make_icon_url(icon: int) -> str:
+    # Serve icon from the local store (filled by update_db.py), falling back to XIVAPI
+    return icon_url(icon)
 
 
 
@@ -560,12 +730,36 @@ def initialize_params():
         if isinstance(val, str) and val.lower() == "none":
             st.session_state[param] = None
 
+    # Admin-only profiling of a single run: ?profile=1&token=<PROFILE_TOKEN>
+    st.session_state["profile_run"] = False
+    if params.get("profile") == "1":
+        token = params.get("token") or ""
+        st.session_state["profile_run"] = bool(PROFILE_TOKEN) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+        # Drop the params so reruns and shared links aren't profiled again
+        del st.query_params["profile"]
+        if "token" in st.query_params:
+            del st.query_params["token"]
+
 if __name__ == "__main__":
     st.set_page_config(layout="wide", page_title="FFXIV Crafting Profit Calculator")
 
     # Initialise data centre and world dfs/lists
+    get_metrics_server()
+    METRICS.inc("page_runs_total")
     initialize_params()
-    worlds_dc_df = get_worlds_dc()
+    if st.session_state.profile_run:
+        # Samples this script run until it finishes, then saves stacks tagged with the request
+        SamplingProfiler(__file__, {key: st.session_state.get(key) for key in ("item", "dc", "world")}).start()
+        METRICS.inc("profiles_captured_total")
+        st.toast("Profiling this run")
+
+    # Detect database rebuilds swapped in by update_db and reload cached frames for the new generation
+    db_gen = db_generation(DB_NAME)
+    if db_gen:
+        # Reopen shared connections first after a swap; until the old pool is closed, any
+        # connection to DB_NAME in this process (incl. fallback loads below) reads the old file
+        get_pool(DB_NAME)
+    worlds_dc_df = get_worlds_dc(db_gen)
     dc_list = worlds_dc_df.select("datacentre").unique().to_series().to_list()
     dc_list.sort()
 
@@ -574,20 +768,22 @@ if __name__ == "__main__":
 
     @st.fragment
     def filter_world(world_list, dc):
-        world_list = (
-            worlds_dc_df.filter(pl.col("datacentre") == dc)
-            .select("world")
-            .to_series()
-            .to_list()
-        )
+        with METRICS.span("db_load", table="worlds_by_dc"):
+            world_list = get_pool(DB_NAME).query("worlds_by_dc", datacentre=dc)["world"].to_list()
         return world_list
     
 
     # Initialise item and recipe dfs/lists
-    all_recipes_df = get_all_recipes()  
+    all_recipes_df = get_all_recipes(db_gen)  
     results_df = all_recipes_df.filter(pl.col("recipe_part") == "result")
-    ingr_df = all_recipes_df.filter(pl.col("recipe_part").str.contains("ingredient"))
 
+    # Start the prefetcher (and watchlist evaluation) on any page, and follow database generations
+    prefetcher = get_prefetcher()
+    prefetcher.recipe_items = get_recipe_item_map(db_gen)
+    try:
+        prefetcher.watchlist = get_watchlist(db_gen)
+    except duckdb.Error:
+        pass  # Watchlist file busy: keep the previous watchlist and retry on the next run
 
     ## Create page elements
     # Create sidebar for settings
@@ -660,15 +856,25 @@ if __name__ == "__main__":
     # Create recipe selectbox, including formatting data
     recipe_selectbox_df = results_df.select(pl.col("selectbox_label","recipe_id", "item_id"))
 
+    # Search server-side so only the top matches (plus the current item) are sent to the browser
+    recipe_query = st.text_input(
+        "Search recipes by item name, item ID or job",
+        placeholder="e.g. tincture, 44162, alc",
+        key="recipe_query")
+    options_df = get_search_index(db_gen).search(recipe_query) if recipe_query else recipe_selectbox_df.head(0)
+    if st.session_state.get("item") is not None:
+        current_df = recipe_selectbox_df.filter(pl.col("item_id") == int(st.session_state.get("item"))).head(1)
+        options_df = pl.concat([current_df, options_df]).unique("selectbox_label", keep="first", maintain_order=True)
+
     def item_selectbox_index() -> int | None:
     # Converts "item" query parameter to index used in selectbox
         item_id = st.session_state.get("item")
-        index = recipe_selectbox_df["item_id"].to_list().index(int(item_id)) if item_id is not None else None
+        index = options_df["item_id"].to_list().index(int(item_id)) if item_id is not None else None
         return index
 
     item_selectbox = st.selectbox(
         label="Select recipe (number in parentheses is item id)",
-        options=recipe_selectbox_df["selectbox_label"],
+        options=options_df["selectbox_label"],
         index=item_selectbox_index())
     
 
@@ -686,6 +892,9 @@ if __name__ == "__main__":
             st.session_state["item"] = item_id
             sync_params_and_redirect(changed=True)
 
+        # Record request so the prefetcher keeps this recipe's prices warm for the next visitor
+        prefetcher.tracker.record(item_id, st.session_state.dc, st.session_state.get("world"))
+
         recipe_id = recipe_selectbox_df.filter(
             pl.col("selectbox_label") == item_selectbox
         ).select("recipe_id").item()
@@ -700,7 +909,8 @@ if __name__ == "__main__":
         cont_ingr = st.empty()
 
         # Prepare data needed for Universalis API GET
-        lookup_items_df = all_recipes_df.filter(pl.col("recipe_id") == recipe_id)
+        with METRICS.span("db_load", table="recipe_by_id"):
+            lookup_items_df = get_pool(DB_NAME).query("recipe_by_id", recipe_id=recipe_id)
         
         # Buy from datacentre if travel is allowed (i.e. same world buy = False), otherwise limit buy to same world
         if not st.session_state.same_world_buy:
@@ -716,4 +926,21 @@ if __name__ == "__main__":
 
         # Fill containers with content from output_df; output of several containers nested inside print_ingredients()
         with cont_ingr:
-            print_ingredients(buy_price_df, sell_price_df)
\ No newline at end of file
+            print_ingredients(buy_price_df, sell_price_df)
+
+    # Planner for buying ingredients for many crafts at once
+    with st.expander("Shopping list planner (multiple crafts)"):
+        print_shopping_planner()
+
+    # Background alerts when watched recipes cross the profit/velocity goals
+    with st.expander("Watchlist alerts"):
+        print_watchlist()
+
+    # Rankings precomputed nightly by profit_scan.py for the selected datacentre
+    with st.expander(f"Most profitable crafts on {st.session_state.dc}"):
+        top_profits_df = get_top_profits(st.session_state.dc, st.session_state.velocity_goal, db_generation(PROFIT_DB_NAME))
+        if top_profits_df is None or top_profits_df.is_empty():
+            st.write("No profit scan results available yet.")
+        else:
+            st.caption(f"Scanned {top_profits_df['scanned_at'].max():%Y-%m-%d %H:%M} UTC; filtered to velocity above {st.session_state.velocity_goal}/day")
+            st.dataframe(top_profits_df.drop("scanned_at"), hide_index=True)
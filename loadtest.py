@@ -0,0 +1,211 @@
+"""Load-test harness simulating many concurrent app sessions against a local Universalis stand-in"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import duckdb
+import polars as pl
+
+from utils import utils
+from utils.snapshot import read_snapshot
+
+DB_NAME = "ffxiv_price.duckdb"
+APP_SCRIPT = "app.py"
+ZIPF_EXPONENT = 1.1  # Popularity skew of recipe requests; roughly what page analytics show for item lookups
+SESSION_TIMEOUT = 60  # Seconds before a simulated page load is counted as failed
+
+logger = utils.setup_logger(__name__)
+
+
+class StandInUniversalis:
+    """Local HTTP server answering Universalis v2 market requests with deterministic synthetic listings.
+
+    Counts every request so the harness can report upstream call volume.
+    """
+
+    def __init__(self, latency: float = 0.05, worlds: Optional[List[str]] = None, port: int = 0):
+        self.latency = latency
+        self.worlds = worlds or ["StandIn"]
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._make_handler())
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v2"
+
+    def item_data(self, item_id: int, hq: bool) -> dict:
+        rng = random.Random(item_id * 2 + hq)
+        base = rng.randint(10, 5000)
+        return {
+            "nqSaleVelocity": round(rng.uniform(0, 60), 2),
+            "hqSaleVelocity": round(rng.uniform(0, 60), 2),
+            "listings": [
+                {
+                    "pricePerUnit": base + rng.randint(0, 500),
+                    "quantity": rng.randint(1, 99),
+                    "hq": hq,
+                    "onMannequin": rng.random() < 0.05,
+                    "worldName": rng.choice(self.worlds),
+                }
+                for _ in range(rng.randint(0, 20))
+            ],
+        }
+
+    def _make_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stand_in._lock:
+                    stand_in.calls += 1
+                path, _, query = self.path.partition("?")
+                hq = "hq=True" in query
+                try:
+                    ids = [int(id) for id in path.rstrip("/").rsplit("/", 1)[1].split(",")]
+                except ValueError:
+                    self.send_error(400)
+                    return
+                if len(ids) == 1:
+                    payload = stand_in.item_data(ids[0], hq)
+                else:
+                    payload = {"items": {str(id): stand_in.item_data(id, hq) for id in ids}}
+                time.sleep(stand_in.latency)
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StandInUniversalis":
+        threading.Thread(target=self.server.serve_forever, name="universalis-stand-in", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+def load_tables() -> tuple:
+    recipes_df, worlds_df = read_snapshot("recipe_price"), read_snapshot("world_dc")
+    if recipes_df is None or worlds_df is None:
+        with duckdb.connect(DB_NAME, read_only=True) as db:
+            recipes_df = db.sql("SELECT * FROM recipe_price").pl()
+            worlds_df = db.sql("SELECT * FROM world_dc").pl()
+    return recipes_df, worlds_df
+
+
+def sample_sessions(recipes_df: pl.DataFrame, worlds_df: pl.DataFrame, n: int, seed: int = 0, exponent: float = ZIPF_EXPONENT) -> List[Dict[str, Optional[str]]]:
+    """Draw `n` page requests: Zipf-distributed items, random datacentre and (half the time) a world in it."""
+    rng = random.Random(seed)
+    items = recipes_df.filter(pl.col("recipe_part") == "result")["item_id"].unique().sort().to_list()
+    rng.shuffle(items)  # Popularity rank is unrelated to item ID
+    weights = [1 / (rank + 1) ** exponent for rank in range(len(items))]
+    worlds_by_dc = {dc: worlds for dc, worlds in worlds_df.group_by("datacentre").agg("world").rows()}
+    dcs = sorted(worlds_by_dc)
+
+    sessions = []
+    for item_id in rng.choices(items, weights=weights, k=n):
+        dc = rng.choice(dcs)
+        world = rng.choice(worlds_by_dc[dc]) if rng.random() < 0.5 else None
+        sessions.append({"item": str(item_id), "dc": dc, "world": world})
+    return sessions
+
+
+def run_session(params: Dict[str, Optional[str]], timeout: float = SESSION_TIMEOUT) -> tuple:
+    """Run one full page load as a fresh Streamlit session; returns (latency seconds, error or None)."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_SCRIPT, default_timeout=timeout)
+    for key, value in params.items():
+        if value is not None:
+            app.query_params[key] = value
+    start = time.perf_counter()
+    try:
+        app.run()
+    except Exception as e:
+        return time.perf_counter() - start, type(e).__name__
+    error = app.exception[0].message if app.exception else None
+    return time.perf_counter() - start, error
+
+
+def run_worker(sessions: List[Dict[str, Optional[str]]], concurrency: int) -> dict:
+    """Simulate one app worker process serving `sessions` with `concurrency` sessions in flight."""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(run_session, sessions))
+    return {
+        "pid": os.getpid(),
+        "latencies": [latency for latency, error in results if error is None],
+        "errors": [error for _, error in results if error is not None],
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def summarise(worker_results: List[dict], elapsed: float, upstream_calls: int) -> dict:
+    latencies = [latency for result in worker_results for latency in result["latencies"]]
+    errors = [error for result in worker_results for error in result["errors"]]
+    sessions = len(latencies) + len(errors)
+    return {
+        "sessions": sessions,
+        "errors": len(errors),
+        "throughput_per_s": round(sessions / elapsed, 2) if elapsed else None,
+        "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1) if latencies else None for p in (50, 90, 95, 99)},
+        "upstream_calls": upstream_calls,
+        "upstream_calls_per_session": round(upstream_calls / sessions, 2) if sessions else None,
+        "worker_max_rss_mb": {result["pid"]: round(result["max_rss_mb"], 1) for result in worker_results},
+    }
+
+
+def main():
+    """Main function to run the load test and print a JSON report."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=200, help="Total simulated page loads")
+    parser.add_argument("--workers", type=int, default=2, help="App worker processes")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent sessions per worker")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Stand-in Universalis response latency")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    recipes_df, worlds_df = load_tables()
+    sessions = sample_sessions(recipes_df, worlds_df, args.sessions, args.seed)
+    stand_in = StandInUniversalis(latency=args.latency_ms / 1000, worlds=worlds_df["world"].to_list()).start()
+
+    # Workers inherit these before importing the app, so it talks to the stand-in
+    os.environ["UNIVERSALIS_URL"] = stand_in.url
+    os.environ["METRICS_PORT"] = "0"
+
+    shards = [sessions[i::args.workers] for i in range(args.workers)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        worker_results = list(pool.map(run_worker, shards, [args.concurrency] * args.workers))
+    elapsed = time.perf_counter() - start
+    stand_in.stop()
+
+    report = summarise(worker_results, elapsed, stand_in.calls)
+    logger.info(f"Load test finished in {elapsed:.1f}s")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
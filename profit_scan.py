@@ -0,0 +1,228 @@
+"""Script to rank crafting profitability of every recipe across all datacentres and regions"""
+
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import duckdb
+import polars as pl
+
+from utils import utils
+from utils.costing import CostEngine
+from utils.db import build_path, remove_database, swap_database
+from utils.snapshot import read_snapshot
+from utils.universalis import PriceCache, get_market_prices, make_requests_session
+
+DB_NAME = "ffxiv_price.duckdb"
+PROFIT_DB_NAME = "profit_scan.duckdb"
+MAX_WORKERS = 4  # Each worker spaces its calls, so this bounds the request rate to Universalis
+
+logger = utils.setup_logger(__name__)
+
+# Per-worker recipe table, loaded once by the pool initializer
+_recipes_df: Optional[pl.DataFrame] = None
+
+
+def load_recipes() -> pl.DataFrame:
+    """Memory-map the recipe snapshot (shared read-only between workers), falling back to DuckDB."""
+    df = read_snapshot("recipe_price")
+    if df is None:
+        with duckdb.connect(DB_NAME, read_only=True) as db:
+            df = db.sql("SELECT * FROM recipe_price").pl()
+    return df
+
+
+def load_markets() -> List[Tuple[str, str]]:
+    """All (scope, name) markets to scan: every datacentre and every region."""
+    df = read_snapshot("world_dc")
+    if df is None:
+        with duckdb.connect(DB_NAME, read_only=True) as db:
+            df = db.sql("SELECT * FROM world_dc").pl()
+    dcs = df["datacentre"].drop_nulls().unique().sort().to_list()
+    regions = df["region"].drop_nulls().unique().sort().to_list()
+    return [("datacentre", dc) for dc in dcs] + [("region", region) for region in regions]
+
+
+def _init_worker() -> None:
+    global _recipes_df
+    _recipes_df = load_recipes()
+
+
+def compute_profits(recipes_df: pl.DataFrame, prices_df: pl.DataFrame) -> pl.DataFrame:
+    """Craft cost from cheapest ingredient sources vs. selling the result, per recipe.
+
+    Args:
+        recipes_df: recipe_price rows for the recipes to evaluate
+        prices_df: Market rows (see utils.universalis.PRICE_SCHEMA) for every item in those recipes
+
+    Returns:
+        One row per recipe with craft cost, HQ (falling back to NQ) sell price, velocity and profit
+    """
+    df = recipes_df.lazy().join(prices_df.lazy(), on="item_id", how="left")
+    ingredients = (
+        df.filter(pl.col("recipe_part").str.contains("ingredient"))
+        .with_columns(pl.min_horizontal("shop_price", "nq_price", "hq_price").alias("cheapest"))
+        .group_by("recipe_id")
+        .agg(
+            # Unpriceable ingredients make the craft cost unknown
+            pl.when(pl.col("cheapest").null_count() == 0)
+            .then((pl.col("item_amount") * pl.col("cheapest")).sum())
+            .alias("craft_cost")
+        )
+    )
+    results = df.filter(pl.col("recipe_part") == "result").select(
+        "recipe_id",
+        "item_id",
+        "item_name",
+        "job",
+        pl.col("item_amount").alias("result_amount"),
+        pl.coalesce("hq_price", "nq_price").alias("sell_price"),
+        pl.when(pl.col("hq_price").is_not_null()).then(pl.col("hq_velocity")).otherwise(pl.col("nq_velocity")).alias("velocity"),
+    )
+    return (
+        results.join(ingredients, on="recipe_id", how="left")
+        .with_columns((pl.col("sell_price") * pl.col("result_amount") - pl.col("craft_cost")).alias("profit"))
+        .with_columns((pl.col("profit") / pl.col("craft_cost")).alias("profit_perc"))
+        .collect()
+    )
+
+
+def buy_prices(recipes_df: pl.DataFrame, prices_df: pl.DataFrame) -> pl.DataFrame:
+    """Cheapest way to buy each item (vendor, NQ or HQ listing), as used for craft costs."""
+    return (
+        recipes_df.select("item_id", "shop_price").unique("item_id")
+        .join(prices_df, on="item_id", how="left")
+        .select("item_id", pl.min_horizontal("shop_price", "nq_price", "hq_price").cast(pl.Float64).alias("buy_price"))
+    )
+
+
+def scan_market(scope: str, market: str) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    """Fetch prices for every recipe item in one market and compute all recipes' profits.
+
+    Each distinct item is fetched once per market, in batches of Universalis' per-call limit,
+    through one session, however many recipes share it.
+
+    Returns:
+        (profits, buy price of every item)
+    """
+    prices_df = get_market_prices(make_requests_session(), PriceCache(), _recipes_df["item_id"].unique(), market)
+    profits_df = compute_profits(_recipes_df, prices_df).with_columns(
+        pl.lit(scope).alias("scope"),
+        pl.lit(market).alias("market"),
+    )
+    return profits_df, buy_prices(_recipes_df, prices_df)
+
+
+def add_subcraft_costs(df: pl.DataFrame, prices_by_market: Dict[str, pl.DataFrame], recipes_df: pl.DataFrame) -> pl.DataFrame:
+    """Add subcraft_cost: craft cost when ingredients that are themselves craftable are crafted
+    wherever that is cheaper than buying them, at each market's prices.
+
+    One CostEngine is built for all recipes and moved from market to market, so each market only
+    reprices the recipes whose ingredient prices differ from the previous market's.
+
+    Args:
+        df: Profits of every market, as returned by `compute_profits` with a market column
+        prices_by_market: Per market, item_id and buy_price of every item in the scanned recipes
+        recipes_df: recipe_price rows of all recipes
+    """
+    engine = CostEngine(recipes_df)
+    frames = []
+    for market, prices_df in prices_by_market.items():
+        prices = dict.fromkeys(engine.buy_price)
+        prices.update(prices_df.unique("item_id").iter_rows())
+        engine.set_prices({item_id: price for item_id, price in prices.items() if engine.buy_price.get(item_id) != price})
+        frames.append(
+            engine.costs()
+            .select(pl.lit(market).alias("market"), pl.col("recipe_id").cast(df.schema["recipe_id"]), pl.col("craft_cost").alias("subcraft_cost"))
+        )
+    costs_df = pl.concat(frames) if frames else pl.DataFrame(schema={"market": pl.String, "recipe_id": df.schema["recipe_id"], "subcraft_cost": pl.Float64})
+    return df.join(costs_df, on=["market", "recipe_id"], how="left")
+
+
+def rank_profits(df: pl.DataFrame) -> pl.DataFrame:
+    """Rank recipes within each market by profit %, most profitable first."""
+    return (
+        df.filter(pl.col("profit").is_not_null())
+        .with_columns(
+            pl.col("profit_perc").rank("ordinal", descending=True).over("scope", "market").alias("rank"),
+            pl.lit(datetime.now(timezone.utc)).alias("scanned_at"),
+        )
+        .select(
+            "scope", "market", "rank", "recipe_id", "item_id", "item_name", "job", "result_amount",
+            "craft_cost", "subcraft_cost", "sell_price", "velocity", "profit", "profit_perc", "scanned_at",
+        )
+        .sort("scope", "market", "rank")
+    )
+
+
+def write_results(df: pl.DataFrame, db_path: str = PROFIT_DB_NAME, keep_markets: Iterable[str] = ()) -> None:
+    """Write ranked results into a fresh database and swap it in, so app readers are never blocked.
+
+    Args:
+        df: Ranked results, as returned by `rank_profits`
+        db_path: Database to replace
+        keep_markets: Markets whose scan failed; their rows are copied from the current database
+            instead, so a partial scan never swaps in missing or incomplete rankings
+    """
+    keep_markets = sorted(set(keep_markets))
+    new_db = build_path(db_path)
+    remove_database(new_db)
+    with duckdb.connect(new_db) as db:
+        db.execute("CREATE TABLE main.profit_scan AS SELECT * FROM df WHERE NOT list_contains($keep, market)", {"keep": keep_markets})
+        if keep_markets and os.path.exists(db_path):
+            quoted_path = db_path.replace("'", "''")
+            db.execute(f"ATTACH '{quoted_path}' AS previous (READ_ONLY)")
+            db.execute("INSERT INTO main.profit_scan BY NAME SELECT * FROM previous.profit_scan WHERE list_contains($keep, market)", {"keep": keep_markets})
+            db.execute("DETACH previous")
+        db.execute("CREATE INDEX profit_scan_market ON main.profit_scan (market, rank)")
+    swap_database(new_db, db_path)
+
+
+def run_scan(workers: int = MAX_WORKERS, markets: Optional[List[str]] = None) -> Tuple[pl.DataFrame, Set[str]]:
+    """Scan each market in its own process and collect ranked results.
+
+    Returns:
+        (ranked results of the markets scanned, markets whose scan failed)
+    """
+    scan_markets = [(scope, name) for scope, name in load_markets() if not markets or name in markets]
+    logger.info(f"Scanning {len(scan_markets)} markets")
+
+    frames, prices_by_market, failed = [], {}, set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(scan_market, scope, market): market for scope, market in scan_markets}
+        for future in as_completed(futures):
+            market = futures[future]
+            try:
+                profits_df, prices_df = future.result()
+            except Exception as e:
+                logger.error(f"Scan of {market} failed: {e}")
+                failed.add(market)
+                continue
+            frames.append(profits_df)
+            prices_by_market[market] = prices_df
+    if not frames:
+        raise RuntimeError("No markets scanned")
+    df = add_subcraft_costs(pl.concat(frames, how="vertical_relaxed"), prices_by_market, load_recipes())
+    return rank_profits(df), failed
+
+
+def main():
+    """Main function to scan profits and write them for the app."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=min(MAX_WORKERS, os.cpu_count() or 1))
+    parser.add_argument("--market", action="append", help="Only scan these datacentres/regions (repeatable)")
+    args = parser.parse_args()
+
+    df, failed = run_scan(args.workers, args.market)
+    write_results(df, keep_markets=failed)
+    logger.info(f"Wrote {len(df)} ranked rows to {PROFIT_DB_NAME}")
+    if failed:
+        logger.error(f"Kept previous rankings for {len(failed)} markets that failed: {', '.join(sorted(failed))}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
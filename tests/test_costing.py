@@ -0,0 +1,39 @@
+import polars as pl
+import pytest
+
+from utils.costing import CostEngine
+
+
+@pytest.fixture
+def recipes_df():
+    # Recipe 1 makes 2x item 100 from 2x item 10 + 1x item 11
+    # Recipe 2 makes item 200 from 1x item 100 (subcraft) + 3x item 12
+    return pl.DataFrame({
+        "recipe_id": [1, 1, 1, 2, 2, 2],
+        "item_id": [100, 10, 11, 200, 100, 12],
+        "item_amount": [2, 2, 1, 1, 1, 3],
+        "recipe_part": ["result", "ingredient0", "ingredient1", "result", "ingredient0", "ingredient1"],
+    })
+
+
+def test_initial_costs_use_cheaper_subcraft(recipes_df):
+    engine = CostEngine(recipes_df, {10: 5, 11: 10, 12: 1, 100: 50})
+    costs = engine.costs().sort("recipe_id")
+    assert costs["craft_cost"].to_list() == [20.0, 13.0]  # item 100 crafts at 10 each, cheaper than buying at 50
+    assert costs["unit_craft_cost"].to_list() == [10.0, 13.0]
+
+
+def test_price_change_reprices_only_dependent_recipes(recipes_df):
+    engine = CostEngine(recipes_df, {10: 5, 11: 10, 12: 1, 100: 50})
+    assert engine.set_prices({12: 2}) == {2}
+    assert engine.set_prices({10: 10}) == {1, 2}
+    assert engine.costs([2])["craft_cost"].item() == 21.0  # 100 now crafts at 15 each
+    # Buying 100 becomes cheaper than crafting it, so recipe 2 changes but not recipe 1
+    assert engine.set_prices({100: 3}) == {2}
+    assert engine.costs([2])["craft_cost"].item() == 9.0
+
+
+def test_missing_prices_and_subcrafts_disabled(recipes_df):
+    engine = CostEngine(recipes_df, {10: 5, 12: 1, 100: 50}, use_subcrafts=False)
+    assert engine.costs([1, 2])["craft_cost"].to_list() == [None, 53.0]
+    assert engine.affected_recipes([10]) == {1, 2}
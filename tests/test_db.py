@@ -0,0 +1,96 @@
+import threading
+
+import duckdb
+import pytest
+
+from utils.db import ConnectionPool, build_path, db_generation, get_pool, swap_database, validate_database
+
+
+def make_db(path, recipe_rows=3, drop_column=None):
+    with duckdb.connect(str(path)) as db:
+        columns = ["recipe_id", "job", "item_id", "item_amount", "recipe_part", "item_name", "item_icon", "shop_price"]
+        columns = [col for col in columns if col != drop_column]
+        db.execute(f"CREATE TABLE recipe_price AS SELECT range AS {', range AS '.join(columns)} FROM range({recipe_rows})")
+        db.execute("CREATE TABLE world_dc AS SELECT 1 AS world_id, 'Anima' AS world, 'Mana' AS datacentre, 'Japan' AS region")
+
+
+def test_validate_and_swap(tmp_path):
+    live = tmp_path / "ffxiv_price.duckdb"
+    new = build_path(str(live))
+    assert db_generation(str(live)) == 0
+    make_db(live)
+    generation = db_generation(str(live))
+
+    make_db(new, recipe_rows=4)
+    with duckdb.connect(new) as db:
+        assert validate_database(db, str(live)) == {"recipe_price": 4, "world_dc": 1}
+    swap_database(new, str(live))
+
+    assert db_generation(str(live)) != generation
+    with duckdb.connect(str(live), read_only=True) as db:
+        assert db.sql("SELECT count(*) FROM recipe_price").fetchone()[0] == 4
+
+
+@pytest.mark.parametrize("kwargs, message", [
+    ({"drop_column": "item_icon"}, "missing columns"),
+    ({"recipe_rows": 0}, "empty"),
+    ({"recipe_rows": 4}, "shrank"),
+])
+def test_validate_rejects_bad_builds(tmp_path, kwargs, message):
+    live = tmp_path / "ffxiv_price.duckdb"
+    make_db(live, recipe_rows=10)
+    new = build_path(str(live))
+    make_db(new, **kwargs)
+    with duckdb.connect(new) as db, pytest.raises(ValueError, match=message):
+        validate_database(db, str(live))
+
+
+def test_connection_pool_named_queries(tmp_path):
+    path = str(tmp_path / "ffxiv_price.duckdb")
+    with duckdb.connect(path) as db:
+        db.execute("""CREATE TABLE recipe_price AS SELECT * FROM (VALUES
+            (1, 'ARM', 100, 1, 'result', 'Ingot'),
+            (1, 'ARM', 5, 3, 'ingredient0', 'Ore'),
+            (2, 'BSM', 200, 1, 'result', 'Blade'),
+            (2, 'BSM', 100, 2, 'ingredient0', 'Ingot'),
+            (2, 'BSM', 6, 1, 'ingredient1', 'Wind Shard')
+        ) AS t(recipe_id, job, item_id, item_amount, recipe_part, item_name)""")
+        db.execute("CREATE TABLE world_dc AS SELECT * FROM (VALUES (1, 'Anima', 'Mana'), (2, 'Ravana', 'Materia')) AS t(world_id, world, datacentre)")
+
+    pool = ConnectionPool(path, size=2)
+    assert pool.generation == db_generation(path)
+    assert pool.query("recipe_by_id", recipe_id=2)["recipe_part"].to_list() == ["ingredient0", "ingredient1", "result"]
+    assert pool.query("worlds_by_dc", datacentre="mana")["world"].to_list() == ["Anima"]
+    with pytest.raises(KeyError):
+        pool.query("missing")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(len(pool.query("recipe_by_id", recipe_id=1)))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [2] * 8
+    pool.close()
+
+
+def test_get_pool_follows_swapped_database(tmp_path):
+    live = str(tmp_path / "ffxiv_price.duckdb")
+    make_db(live, recipe_rows=3)
+    pool = get_pool(live)
+    assert pool.query("recipe_by_id", recipe_id=2)["item_id"].to_list() == [2]
+    assert get_pool(live) is pool
+
+    new = build_path(live)
+    make_db(new, recipe_rows=5)
+    swap_database(new, live)
+
+    new_pool = get_pool(live)
+    assert new_pool.query("recipe_by_id", recipe_id=4)["item_id"].to_list() == [4]
+    # Other connections in the process read the new file too
+    with duckdb.connect(live, read_only=True) as db:
+        assert db.sql("SELECT count(*) FROM recipe_price").fetchone()[0] == 5
+    assert pool.closed
+    with pytest.raises(RuntimeError):
+        pool.query("recipe_by_id", recipe_id=1)
+    new_pool.close()
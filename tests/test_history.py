@@ -0,0 +1,132 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import duckdb
+import polars as pl
+
+from utils.history import PriceHistory, resolution_for
+from utils.universalis import PRICE_SCHEMA
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def market(item_id, hq_price, hq_velocity=10.0):
+    return pl.DataFrame([{"item_id": item_id, "nq_price": None, "nq_velocity": None, "nq_world": None,
+                          "hq_price": hq_price, "hq_velocity": hq_velocity, "hq_world": "Anima"}], schema=PRICE_SCHEMA)
+
+
+def table_count(history, table):
+    with duckdb.connect(history.db_path) as db:
+        return db.sql(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+
+def test_resolution_for():
+    assert resolution_for(START - timedelta(hours=12), START) == "raw"
+    assert resolution_for(START - timedelta(days=14), START) == "hourly"
+    assert resolution_for(START - timedelta(days=180), START) == "daily"
+
+
+def test_record_compact_and_query(tmp_path):
+    history = PriceHistory(str(tmp_path / "price_history.duckdb"), flush_rows=10_000)
+    # Four observations an hour (15 minutes apart) for three days
+    for step in range(4 * 24 * 3):
+        observed_at = START + timedelta(minutes=15 * step)
+        history.record("Mana", market(5, 100 + step % 4, hq_velocity=float(step % 2)), observed_at)
+    assert history.flush() == 4 * 24 * 3  # NQ side has neither price nor velocity, so is skipped
+
+    now = START + timedelta(days=3, minutes=1)
+    history.compact(now)
+    assert table_count(history, "price_raw") == 4 * 24 * 2  # Hours older than two days dropped
+    assert table_count(history, "price_hourly") == 24 * 3
+    assert table_count(history, "price_daily") == 3
+
+    history.export_snapshot()
+    hourly = history.history(5, "mana", START, now - timedelta(hours=1), hq=True, now=now)
+    assert len(hourly) == 24 * 3
+    assert hourly.row(0, named=True) | {"bucket": None} == {
+        "bucket": None, "hq": True, "open": 100.0, "high": 103.0, "low": 100.0, "close": 103.0, "velocity": 0.5, "samples": 4,
+    }
+
+    daily = history.history(5, "Mana", START - timedelta(days=90), now=now)
+    assert daily["samples"].to_list() == [96, 96, 96]
+    assert daily["bucket"].to_list() == [START + timedelta(days=day) for day in range(3)]
+
+    raw = history.history(5, "Mana", now - timedelta(hours=2, minutes=1), now=now)
+    assert len(raw) == 8
+    assert history.history(6, "Mana", now - timedelta(hours=2), now=now).is_empty()
+
+
+def test_queries_include_uncompacted_tail(tmp_path):
+    history = PriceHistory(str(tmp_path / "price_history.duckdb"))
+    for hour in range(3):
+        history.record("Mana", market(5, 200 + hour), START + timedelta(hours=hour))
+    history.compact(START + timedelta(hours=1, minutes=30))  # Only the first hour is compacted
+    history.export_snapshot()
+
+    now = START + timedelta(days=10)
+    hourly = history.history(5, "Mana", START - timedelta(days=1), now=now)
+    assert hourly["close"].to_list() == [200.0, 201.0, 202.0]
+    daily = history.history(5, "Mana", START - timedelta(days=100), now=now)
+    assert daily.select("open", "high", "low", "close", "samples").row(0) == (200.0, 202.0, 200.0, 202.0, 3)
+
+
+def test_compaction_is_idempotent(tmp_path):
+    history = PriceHistory(str(tmp_path / "price_history.duckdb"))
+    history.record("Mana", market(5, 100), START)
+    now = START + timedelta(hours=2)
+    history.compact(now)
+    history.compact(now)
+    history.compact(now + timedelta(days=1, hours=1))
+    assert table_count(history, "price_hourly") == 1
+    assert table_count(history, "price_daily") == 1
+
+
+def test_late_observations_reach_compacted_bars(tmp_path):
+    history = PriceHistory(str(tmp_path / "price_history.duckdb"))
+    history.record("Mana", market(5, 100), START)
+    now = START + timedelta(days=1, hours=2)
+    history.compact(now)
+
+    # Flushed by another worker after its hour and day were already rolled up
+    late = PriceHistory(history.db_path)
+    late.record("Mana", market(5, 90), START + timedelta(minutes=30))
+    late.flush()
+    history.compact(now)
+    history.export_snapshot()
+
+    hourly = history.history(5, "Mana", START - timedelta(days=1), now=now)
+    assert hourly.select("open", "low", "close", "samples").rows() == [(100.0, 90.0, 90.0, 2)]
+    daily = history.history(5, "Mana", START - timedelta(days=100), now=now)
+    assert daily.select("open", "low", "close", "samples").rows() == [(100.0, 90.0, 90.0, 2)]
+
+
+def test_background_thread_flushes_buffer(tmp_path):
+    history = PriceHistory(str(tmp_path / "price_history.duckdb"), flush_rows=2, flush_interval=60)
+    history.record("Mana", market(5, 100), START)
+    assert table_count(history, "price_raw") == 0  # Recording never writes on the caller's thread
+
+    history.start()
+    history.record("Mana", market(6, 100), START)  # Reaching flush_rows wakes the thread
+    for _ in range(100):
+        if table_count(history, "price_raw") == 2:
+            break
+        time.sleep(0.05)
+    history.stop()
+    assert table_count(history, "price_raw") == 2
+
+
+def test_history_reads_snapshot_without_write_lock(tmp_path):
+    history = PriceHistory(str(tmp_path / "price_history.duckdb"))
+    now = START + timedelta(hours=2)
+    assert history.history(5, "Mana", START, now=now).is_empty()  # No snapshot exported yet
+
+    history.record("Mana", market(5, 100), START)
+    history.flush()
+    history.export_snapshot()
+    history.record("Mana", market(5, 110), START + timedelta(minutes=5))
+    history.flush()
+    # Reads don't open the history file, so they proceed while it is held open for writing
+    with duckdb.connect(history.db_path):
+        assert history.history(5, "Mana", START, now=now)["close"].to_list() == [100.0]
+    history.export_snapshot()
+    assert history.history(5, "Mana", START, now=now)["close"].to_list() == [100.0, 110.0]
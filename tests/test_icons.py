@@ -0,0 +1,58 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.icons import download_icons, icon_game_path, icon_url, local_icon_path
+
+
+@pytest.fixture
+def icon_source():
+    """Local stand-in for the asset API: serves the requested game path as the PNG body."""
+    requested = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested.append(self.path)
+            if "999999" in self.path:
+                self.send_error(404)
+                return
+            body = self.path.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/asset", requested
+    server.shutdown()
+
+
+def test_icon_game_path():
+    assert icon_game_path(20651) == "ui/icon/020000/020651.tex"
+    assert icon_game_path(60101) == "ui/icon/060000/060101.tex"
+
+
+def test_download_icons_fetches_only_missing(tmp_path, icon_source):
+    base_url, requested = icon_source
+
+    assert download_icons([20651, 20651, 60101, None], tmp_path, base_url) == 2
+    assert local_icon_path(20651, tmp_path).read_bytes().endswith(b"path=ui/icon/020000/020651.tex&format=png")
+    assert len(requested) == 2
+
+    assert download_icons([20651, 60101], tmp_path, base_url) == 0
+    assert len(requested) == 2
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+def test_failed_download_falls_back_to_remote_url(tmp_path, icon_source):
+    base_url, _ = icon_source
+
+    assert download_icons([999999, 20651], tmp_path, base_url) == 1
+    assert icon_url(20651, tmp_path) == "app/static/icons/020000/020651.png"
+    assert icon_url(999999, tmp_path).startswith("https://v2.xivapi.com/api/asset?path=ui/icon/999000/999999.tex")
@@ -0,0 +1,37 @@
+import polars as pl
+import requests
+
+from loadtest import StandInUniversalis, percentile, sample_sessions, summarise
+
+
+def test_stand_in_serves_universalis_shapes():
+    stand_in = StandInUniversalis(latency=0).start()
+    try:
+        many = requests.get(f"{stand_in.url}/Mana/1,2", params={"hq": True}).json()
+        single = requests.get(f"{stand_in.url}/Mana/1", params={"hq": True}).json()
+    finally:
+        stand_in.stop()
+    assert set(many["items"]) == {"1", "2"}
+    assert single == many["items"]["1"]
+    assert stand_in.calls == 2
+
+
+def test_sample_sessions_is_skewed_and_reproducible():
+    recipes_df = pl.DataFrame({"item_id": list(range(100)), "recipe_part": ["result"] * 100})
+    worlds_df = pl.DataFrame({"world": ["Anima", "Ravana"], "datacentre": ["Mana", "Materia"]})
+    sessions = sample_sessions(recipes_df, worlds_df, 500, seed=1)
+    assert sessions == sample_sessions(recipes_df, worlds_df, 500, seed=1)
+    # The most popular item gets far more than a uniform 1% share
+    top_count = max(sum(s["item"] == item for s in sessions) for item in {s["item"] for s in sessions})
+    assert top_count > 50
+    assert all(s["world"] in (None, {"Mana": "Anima", "Materia": "Ravana"}[s["dc"]]) for s in sessions)
+
+
+def test_summarise():
+    results = [{"pid": 1, "latencies": [0.1, 0.2, 0.3], "errors": ["Timeout"], "max_rss_mb": 200.0}]
+    report = summarise(results, elapsed=2.0, upstream_calls=6)
+    assert report["sessions"] == 4 and report["errors"] == 1
+    assert report["throughput_per_s"] == 2.0
+    assert report["latency_ms"]["p50"] == 200.0
+    assert report["upstream_calls_per_session"] == 1.5
+    assert percentile([], 95) is None
@@ -0,0 +1,57 @@
+import json
+import urllib.request
+
+import pytest
+
+from utils.metrics import Metrics, start_metrics_server
+
+
+def test_span_records_histogram_and_fields(caplog):
+    metrics = Metrics()
+    with caplog.at_level("DEBUG"):
+        with metrics.span("db_load", table="recipe_price") as span:
+            span["rows"] = 3
+
+    text = metrics.render_prometheus()
+    assert 'db_load_seconds_count{table="recipe_price"} 1' in text
+    assert 'db_load_seconds_bucket{table="recipe_price",le="+Inf"} 1' in text
+    record = json.loads(caplog.records[-1].getMessage())
+    assert record["span"] == "db_load" and record["rows"] == 3
+
+
+def test_span_records_errors():
+    metrics = Metrics()
+    with pytest.raises(ValueError):
+        with metrics.span("render"):
+            raise ValueError
+    assert metrics.snapshot()["histograms"]["render_seconds"][0]["count"] == 1
+
+
+def test_counters_and_timed_decorator():
+    metrics = Metrics()
+    metrics.inc("universalis_requests_total", status=200)
+    metrics.inc("universalis_requests_total", status=200)
+
+    @metrics.timed("render", function="f")
+    def f():
+        return 1
+
+    assert f() == 1
+    text = metrics.render_prometheus()
+    assert 'universalis_requests_total{status="200"} 2' in text
+    assert 'render_seconds_count{function="f"} 1' in text
+
+
+def test_metrics_server():
+    metrics = Metrics()
+    metrics.inc("page_runs_total")
+    server = start_metrics_server(0, metrics)
+    try:
+        host, port = server.server_address
+        assert host == "127.0.0.1"
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+        assert "page_runs_total 1" in body
+        data = json.loads(urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics.json").read())
+        assert data["counters"]["page_runs_total"][0]["value"] == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,88 @@
+import polars as pl
+import pytest
+
+from utils.planner import aggregate_demand, assign_purchases, build_ingredient_matrix
+
+
+@pytest.fixture
+def recipes_df():
+    return pl.DataFrame({
+        "recipe_id": [1, 1, 1, 2, 2],
+        "item_id": [100, 10, 11, 200, 10],
+        "item_amount": [3, 2, 1, 1, 4],
+        "recipe_part": ["result", "ingredient0", "ingredient1", "result", "ingredient0"],
+        "shop_price": [None, None, 50, None, None],
+    })
+
+
+def test_aggregate_demand_rounds_up_to_whole_crafts(recipes_df):
+    matrix, results = build_ingredient_matrix(recipes_df)
+    demand = aggregate_demand([(1, 7), (2, 2), (1, 2)], matrix, results)
+    # Recipe 1: 9 wanted / 3 per craft = 3 crafts; recipe 2: 2 crafts
+    assert demand.rows() == [(10, 3 * 2 + 2 * 4), (11, 3)]
+
+
+def test_assign_purchases_cheapest_first_with_whole_listings():
+    demand = pl.DataFrame({"item_id": [10, 11], "demand": [5, 3]})
+    listings = pl.DataFrame({
+        "item_id": [10, 10, 10, 11],
+        "world": ["Anima", "Ixion", "Titan", "Anima"],
+        "hq": [False, True, False, False],
+        "price_per_unit": [10, 12, 20, 60],
+        "quantity": [3, 4, 10, 3],
+    })
+    shop = pl.DataFrame({"item_id": [10, 11], "shop_price": [None, 50]})
+
+    plan = assign_purchases(demand, listings, shop)
+    assert plan.purchases.select("world", "item_id", "quantity", "cost").rows() == [
+        ("Anima", 10, 3, 30),
+        ("Ixion", 10, 4, 48),
+        ("Shop", 11, 3, 150),
+    ]
+    assert plan.total_cost == 228
+    assert plan.shortfall.is_empty()
+    assert plan.by_world()["world"].to_list() == ["Shop", "Ixion", "Anima"]
+
+
+def test_assign_purchases_reports_shortfall():
+    demand = pl.DataFrame({"item_id": [10], "demand": [5]})
+    listings = pl.DataFrame({"item_id": [10], "world": ["Anima"], "hq": [False], "price_per_unit": [10], "quantity": [2]})
+    plan = assign_purchases(demand, listings, pl.DataFrame({"item_id": [10], "shop_price": [None]}))
+    assert plan.shortfall.rows() == [(10, 3)]
+
+
+@pytest.mark.parametrize("listing_quantity, listing_price", [(99, 5), (2, 6)])
+def test_assign_purchases_minimises_total_cost_not_unit_price(listing_quantity, listing_price):
+    demand = pl.DataFrame({"item_id": [10], "demand": [2]})
+    listings = pl.DataFrame({
+        "item_id": [10, 10],
+        "world": ["Anima", "Titan"],
+        "hq": [False, False],
+        "price_per_unit": [listing_price, 11],
+        "quantity": [listing_quantity, 1],
+    })
+    plan = assign_purchases(demand, listings, pl.DataFrame({"item_id": [10], "shop_price": [10]}))
+    if listing_quantity == 99:
+        # 99 units for 495 overshoots badly; the vendor covers both for 20
+        assert plan.purchases.select("world", "quantity", "cost").rows() == [("Shop", 2, 20)]
+    else:
+        assert plan.purchases.select("world", "quantity", "cost").rows() == [("Anima", 2, 12)]
+
+
+def test_assign_purchases_prefers_small_listing_covering_remainder():
+    demand = pl.DataFrame({"item_id": [10], "demand": [5]})
+    listings = pl.DataFrame({
+        "item_id": [10, 10, 10],
+        "world": ["Anima", "Ixion", "Titan"],
+        "hq": [False, False, False],
+        "price_per_unit": [5, 6, 9],
+        "quantity": [4, 50, 1],
+    })
+    shop = pl.DataFrame({"item_id": [10], "shop_price": [None]})
+    plan = assign_purchases(demand, listings, shop)
+    assert plan.purchases.select("world", "quantity", "cost").rows() == [("Anima", 4, 20), ("Titan", 1, 9)]
+    assert plan.shortfall.is_empty()
+
+    # With a vendor, the last unit is cheaper from the shop than the Titan listing
+    plan = assign_purchases(demand, listings, shop.with_columns(pl.lit(7).alias("shop_price")))
+    assert plan.purchases.select("world", "quantity", "cost").rows() == [("Anima", 4, 20), ("Shop", 1, 7)]
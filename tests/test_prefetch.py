@@ -0,0 +1,110 @@
+import polars as pl
+import pytest
+
+from utils import universalis
+from utils.prefetch import PopularityTracker, Prefetcher, build_recipe_item_map
+from utils.universalis import PriceCache, get_market_prices, parse_market_data
+
+
+class FakeResponse:
+    status_code = 200
+    content = b"{}"
+    raw = None
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    """Stand-in for requests.Session returning canned Universalis responses."""
+
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params, timeout):
+        self.calls.append(url)
+        ids = url.rsplit("/", 1)[1].split(",")
+        items = {
+            id: {
+                "nqSaleVelocity": 1.5,
+                "hqSaleVelocity": 2.5,
+                "listings": [
+                    {"pricePerUnit": 100 + int(id), "onMannequin": False, "worldName": "Anima"},
+                    {"pricePerUnit": 50, "onMannequin": True, "worldName": "Anima"},
+                ],
+            }
+            for id in ids
+        }
+        return FakeResponse(items[ids[0]] if len(ids) == 1 else {"items": items})
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(universalis.time, "sleep", lambda _: None)
+
+
+@pytest.fixture
+def recipes_df():
+    return pl.DataFrame({
+        "recipe_id": [1, 1, 1, 2, 2],
+        "item_id": [10, 11, 12, 20, 11],
+        "recipe_part": ["result", "ingredient0", "ingredient1", "result", "ingredient0"],
+    })
+
+
+def test_parse_market_data_ignores_mannequins():
+    data = {"5": {"nqSaleVelocity": 3.0, "listings": [
+        {"pricePerUnit": 10, "onMannequin": True, "worldName": "Anima"},
+        {"pricePerUnit": 20, "onMannequin": False, "worldName": "Ixion"},
+    ]}}
+    df = parse_market_data(data, "Mana", hq=False)
+    assert df.row(0, named=True) == {"item_id": 5, "nq_price": 20, "nq_velocity": 3.0, "nq_world": "Ixion"}
+
+
+def test_get_market_prices_only_fetches_missing_items():
+    session, cache = FakeSession(), PriceCache()
+    get_market_prices(session, cache, [1, 2], "Mana")
+    assert len(session.calls) == 2  # One NQ and one HQ call
+
+    df = get_market_prices(session, cache, [1, 2, 3], "Mana")
+    assert session.calls[-1].endswith("/Mana/3")
+    assert df["item_id"].to_list() == [1, 2, 3]
+    assert df["hq_price"].to_list() == [101, 102, 103]
+
+
+def test_price_cache_expiry():
+    cache = PriceCache(ttl=10)
+    cache.put("Mana", pl.DataFrame({"item_id": [1]}).join(universalis.empty_prices(), on="item_id", how="left"), now=0)
+    assert cache.get("mana", [1], now=5)[1] == []
+    assert cache.get("mana", [1], now=11)[1] == [1]
+    assert cache.expiring("Mana", [1, 2], within=6, now=5) == [1, 2]
+
+
+def test_popularity_tracker_decays_old_requests():
+    tracker = PopularityTracker(half_life=10)
+    for _ in range(4):
+        tracker.record(1, "Mana")
+    tracker.decay(now=tracker._last_decay + 20)
+    tracker.record(2, "Mana", "Anima")
+    tracker.record(2, "Mana", "Anima")
+    assert tracker.top(1) == [(2, "Mana", "Anima")]
+
+
+def test_build_recipe_item_map(recipes_df):
+    assert build_recipe_item_map(recipes_df) == {10: [10, 11, 12], 20: [20, 11]}
+
+
+def test_prefetcher_refreshes_popular_recipes_once(recipes_df):
+    session, cache, tracker = FakeSession(), PriceCache(), PopularityTracker()
+    tracker.record(10, "Mana", "Anima")
+    prefetcher = Prefetcher(tracker, cache, build_recipe_item_map(recipes_df), lambda: session, min_call_interval=0)
+
+    assert prefetcher.run_once() == 6  # 3 items for each of the dc and world
+    assert cache.get("Anima", [10, 11, 12])[1] == []
+    assert prefetcher.run_once() == 0
@@ -0,0 +1,32 @@
+import json
+import threading
+
+from utils.profiler import SamplingProfiler
+
+SCRIPT = """
+import time
+
+def slow_render():
+    time.sleep(0.1)
+
+profiler = SamplingProfiler(__file__, {"item": 5057, "dc": "Mana", "world": None}, interval=0.002, output_dir=output_dir)
+profiler.start()
+slow_render()
+"""
+
+
+def test_profiler_captures_one_script_run(tmp_path):
+    script_path = str(tmp_path / "app.py")
+    namespace = {"__file__": script_path, "SamplingProfiler": SamplingProfiler, "output_dir": tmp_path / "profiles"}
+    thread = threading.Thread(target=exec, args=(compile(SCRIPT, script_path, "exec"), namespace))
+    thread.start()
+    thread.join()
+
+    profiler = namespace["profiler"]
+    assert profiler.wait(timeout=5)
+    assert profiler.output_path.name.endswith("_5057_Mana_None.folded")
+    assert any("slow_render (app.py:4)" in stack for stack in profiler.stacks)
+
+    summary = json.loads(profiler.output_path.with_suffix(".json").read_text())
+    assert summary["dc"] == "Mana" and summary["samples"] > 0
+    assert summary["top_functions"][0]["total"] == summary["samples"]
@@ -0,0 +1,105 @@
+import duckdb
+import polars as pl
+
+from profit_scan import add_subcraft_costs, buy_prices, compute_profits, rank_profits, write_results
+
+
+def test_compute_and_rank_profits(tmp_path):
+    recipes_df = pl.DataFrame({
+        "recipe_id": [1, 1, 1, 2, 2],
+        "job": ["ALC"] * 3 + ["CUL"] * 2,
+        "item_id": [100, 10, 11, 200, 10],
+        "item_amount": [2, 2, 1, 1, 1],
+        "recipe_part": ["result", "ingredient0", "ingredient1", "result", "ingredient0"],
+        "item_name": ["Potion", "Water", "Herb", "Soup", "Water"],
+        "shop_price": [None, 5, None, None, 5],
+    })
+    prices_df = pl.DataFrame({
+        "item_id": [100, 10, 11, 200],
+        "nq_price": [40, 8, 20, 30],
+        "nq_velocity": [1.0, 5.0, 5.0, 2.0],
+        "hq_price": [60, None, 15, None],
+        "hq_velocity": [3.0, None, 1.0, None],
+    })
+
+    df = compute_profits(recipes_df, prices_df).sort("recipe_id")
+    # Recipe 1: 2 water @5 (shop) + 1 herb @15 (HQ) = 25; sells 2 x 60 HQ
+    assert df.select("craft_cost", "sell_price", "velocity", "profit").rows() == [(25, 60, 3.0, 95), (5, 30, 2.0, 25)]
+
+    prices = buy_prices(recipes_df, prices_df)
+    ranked = rank_profits(add_subcraft_costs(pl.concat([
+        df.with_columns(pl.lit("datacentre").alias("scope"), pl.lit("Mana").alias("market")),
+        df.with_columns(pl.lit("region").alias("scope"), pl.lit("Japan").alias("market")),
+    ]), {"Mana": prices, "Japan": prices}, recipes_df))
+    # Ranked by profit %: recipe 2 (500%) ahead of recipe 1 (380%)
+    assert ranked.filter(pl.col("market") == "Mana").select("rank", "recipe_id").rows() == [(1, 2), (2, 1)]
+
+    db_path = str(tmp_path / "profit_scan.duckdb")
+    write_results(ranked, db_path)
+    with duckdb.connect(db_path, read_only=True) as db:
+        assert db.sql("SELECT count(*) FROM profit_scan WHERE market = 'Japan'").fetchone()[0] == 2
+
+
+def test_write_results_keeps_previous_rows_of_failed_markets(tmp_path):
+    def ranked(markets, profit):
+        return rank_profits(pl.DataFrame({
+            "scope": ["datacentre"] * len(markets), "market": markets, "recipe_id": [1] * len(markets),
+            "item_id": [100] * len(markets), "item_name": ["Potion"] * len(markets), "job": ["ALC"] * len(markets),
+            "result_amount": [1] * len(markets), "craft_cost": [10] * len(markets), "sell_price": [10 + profit] * len(markets),
+            "velocity": [1.0] * len(markets), "profit": [profit] * len(markets), "profit_perc": [profit / 10] * len(markets),
+            "subcraft_cost": [10.0] * len(markets),
+        }))
+
+    db_path = str(tmp_path / "profit_scan.duckdb")
+    write_results(ranked(["Mana", "Japan"], 5), db_path)
+    # Rescan where every Japan shard's rows were dropped because one of them failed
+    write_results(ranked(["Mana"], 7), db_path, keep_markets={"Japan"})
+    with duckdb.connect(db_path, read_only=True) as db:
+        assert db.sql("SELECT market, profit FROM profit_scan ORDER BY market").fetchall() == [("Japan", 5), ("Mana", 7)]
+
+
+def test_subcraft_costs_per_market():
+    # Recipe 1 makes item 100 from 2x item 10; recipe 2 makes item 200 from item 100 + item 11
+    recipes_df = pl.DataFrame({
+        "recipe_id": [1, 1, 2, 2, 2],
+        "item_id": [100, 10, 200, 100, 11],
+        "item_amount": [1, 2, 1, 1, 1],
+        "recipe_part": ["result", "ingredient0", "result", "ingredient0", "ingredient1"],
+    })
+    profits_df = pl.DataFrame({"market": ["Mana", "Mana", "Japan", "Japan"], "recipe_id": [1, 2, 1, 2]})
+    prices = {
+        "Mana": pl.DataFrame({"item_id": [10, 11, 100, 200], "buy_price": [5.0, 1.0, 50.0, 100.0]}),
+        # Item 100 is cheaper to buy than to craft here
+        "Japan": pl.DataFrame({"item_id": [10, 11, 100], "buy_price": [30.0, 2.0, 40.0]}),
+    }
+    df = add_subcraft_costs(profits_df, prices, recipes_df)
+    assert df.select("market", "recipe_id", "subcraft_cost").rows() == [
+        ("Mana", 1, 10.0), ("Mana", 2, 11.0), ("Japan", 1, 60.0), ("Japan", 2, 42.0),
+    ]
+
+
+def test_scan_market_fetches_each_item_once(monkeypatch):
+    import profit_scan
+    from tests.test_prefetch import FakeSession
+    from utils import universalis
+
+    # Item 10 is an ingredient of both recipes
+    monkeypatch.setattr(profit_scan, "_recipes_df", pl.DataFrame({
+        "recipe_id": [1, 1, 2, 2],
+        "job": ["ALC"] * 4,
+        "item_id": [100, 10, 200, 10],
+        "item_amount": [1, 1, 1, 1],
+        "recipe_part": ["result", "ingredient0", "result", "ingredient0"],
+        "item_name": ["Potion", "Water", "Soup", "Water"],
+        "shop_price": [None, None, None, None],
+    }))
+    session = FakeSession()
+    monkeypatch.setattr(profit_scan, "make_requests_session", lambda: session)
+    monkeypatch.setattr(universalis.time, "sleep", lambda _: None)
+
+    profits_df, prices_df = profit_scan.scan_market("datacentre", "Mana")
+    # One NQ and one HQ call for all three items
+    assert len(session.calls) == 2
+    assert all(sorted(call.rsplit("/", 1)[1].split(",")) == ["10", "100", "200"] for call in session.calls)
+    assert profits_df.sort("recipe_id")["craft_cost"].to_list() == [110, 110]
+    assert prices_df.height == 3
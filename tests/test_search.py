@@ -0,0 +1,52 @@
+import polars as pl
+import pytest
+
+from utils.search import RecipeSearchIndex
+
+
+@pytest.fixture
+def index():
+    df = pl.DataFrame({
+        "recipe_id": [1, 2, 3, 4, 5],
+        "item_id": [5057, 5057, 44162, 44163, 12],
+        "item_name": ["Iron Ingot", "Iron Ingot", "Grade 8 Tincture of Strength", "Grade 8 Tincture of Mind", "Mythril Rivets"],
+        "job": ["ARM", "BSM", "ALC", "ALC", "GSM"],
+        "recipe_part": ["result"] * 5,
+    })
+    return RecipeSearchIndex(df.with_columns(pl.col("item_name").alias("selectbox_label")))
+
+
+def test_search_by_name_prefix(index):
+    assert index.search("tinc str")["recipe_id"].to_list() == [3]
+    assert index.search("grade 8")["recipe_id"].to_list() == [4, 3]
+
+
+def test_search_by_item_id(index):
+    assert index.search("44162")["recipe_id"].to_list() == [3]
+    assert sorted(index.search("4416")["recipe_id"]) == [3, 4]
+
+
+def test_search_by_job(index):
+    assert index.search("iron bsm")["recipe_id"].to_list() == [2]
+    assert index.search("alc")["recipe_id"].to_list() == [4, 3]
+
+
+def test_search_fuzzy_and_limit(index):
+    assert index.search("mythirl rivets")["recipe_id"].to_list() == [5]
+    assert index.search("")["recipe_id"].to_list() == []
+    assert len(index.search("i", limit=1)) == 1
+
+
+def test_job_word_also_matches_names():
+    df = pl.DataFrame({
+        "recipe_id": [1, 2, 3, 4, 5],
+        "item_id": [5057, 3245, 5058, 27839, 44162],
+        "item_name": ["Iron Ingot", "Iron Armguards", "Alchemic Cloth", "Iron Arm Spikes", "Grade 8 Tincture of Strength"],
+        "job": ["ARM", "BSM", "WVR", "ARM", "ALC"],
+        "recipe_part": ["result"] * 5,
+    })
+    index = RecipeSearchIndex(df.with_columns(pl.col("item_name").alias("selectbox_label")))
+    # "arm" is both a job and a name prefix: literal name matches first, then the job's recipes
+    assert index.search("iron arm")["recipe_id"].to_list() == [4, 2, 1]
+    assert index.search("alc")["recipe_id"].to_list() == [3, 5]
+    assert index.search("iron bsm")["recipe_id"].to_list() == [2]  # No name word starts with "bsm"
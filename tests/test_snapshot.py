@@ -0,0 +1,26 @@
+import polars as pl
+
+from utils.snapshot import read_snapshot, snapshots_exist, write_snapshot
+from utils.utils import add_selectbox_label
+
+
+def test_snapshot_round_trip(tmp_path):
+    df = pl.DataFrame({"world_id": [21, 22], "world": ["Ravana", "Bismarck"], "datacentre": ["Materia", "Materia"]})
+    assert read_snapshot("world_dc", tmp_path) is None
+
+    write_snapshot(df, "world_dc", tmp_path)
+    assert read_snapshot("world_dc", tmp_path).equals(df)
+    assert not snapshots_exist(tmp_path)  # recipe_price still missing
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_add_selectbox_label_marks_two_job_items():
+    df = pl.DataFrame({
+        "recipe_id": [1, 1, 2, 3],
+        "job": ["ARM", "ARM", "BSM", "CUL"],
+        "item_id": [100, 5, 100, 200],
+        "item_name": ["Ingot", "Ore", "Ingot", "Soup"],
+        "recipe_part": ["result", "ingredient0", "result", "result"],
+    })
+    labels = add_selectbox_label(df)["selectbox_label"].to_list()
+    assert labels == ["Ingot (100) (ARM)", "Ore (5) (ARM)", "Ingot (100) (BSM)", "Soup (200)"]
@@ -0,0 +1,141 @@
+import json
+
+import polars as pl
+import pytest
+
+from utils.universalis import PRICE_SCHEMA, PriceCache
+from utils.watchlist import FileSink, OwnerLock, Watchlist, WatchlistStore
+
+
+@pytest.fixture
+def recipes_df():
+    # Recipe 1: 2x item 11 + 1x item 12 -> 1x item 10; recipe 2 is unrelated
+    return pl.DataFrame({
+        "recipe_id": [1, 1, 1, 2, 2],
+        "item_id": [10, 11, 12, 20, 21],
+        "item_amount": [1, 2, 1, 1, 1],
+        "recipe_part": ["result", "ingredient0", "ingredient1", "result", "ingredient0"],
+        "shop_price": [None, None, 30, None, None],
+    })
+
+
+def prices(rows):
+    return pl.DataFrame(rows, schema=PRICE_SCHEMA)
+
+
+def market(item_id, hq_price, hq_velocity=50.0):
+    return {"item_id": item_id, "nq_price": None, "nq_velocity": 0.0, "nq_world": None,
+            "hq_price": hq_price, "hq_velocity": hq_velocity, "hq_world": "Anima"}
+
+
+def test_store_round_trip(tmp_path):
+    store = WatchlistStore(str(tmp_path / "watchlist.duckdb"))
+    rule_id = store.add_rule(1, "Mana", None, 0.25, 40)
+    store.add_rule(2, "Mana", "Anima", 0.1, 10)
+    assert [(rule.rule_id, rule.recipe_id, rule.world, rule.last_state) for rule in store.rules()] == [
+        (rule_id, 1, None, None), (rule_id + 1, 2, "Anima", None)
+    ]
+    store.remove_rule(rule_id)
+    assert [rule.recipe_id for rule in WatchlistStore(store.db_path).rules()] == [2]
+
+
+def test_alerts_only_when_affected_rule_crosses_goal(tmp_path, recipes_df):
+    store = WatchlistStore(str(tmp_path / "watchlist.duckdb"))
+    store.add_rule(1, "Mana", None, 0.25, 40)
+    store.add_rule(2, "Mana", None, 0.25, 40)
+    sink = FileSink(tmp_path / "alerts.jsonl")
+    watchlist = Watchlist(store, recipes_df, sinks=[sink])
+    assert watchlist.requests() == [(10, "Mana", None), (20, "Mana", None)]
+    cache = PriceCache()
+
+    # Cost 2*50 + 30 (shop) = 130; selling for 150 is a 15% margin, below goal
+    batch = prices([market(10, 150), market(11, 50), market(12, 100)])
+    cache.put("Mana", batch)
+    assert watchlist.on_prices("Mana", batch, cache) == []
+    assert store.rules()[0].last_state is False
+
+    # Unchanged prices re-evaluate nothing
+    assert watchlist.affected_rules("Mana", watchlist.changed_items("Mana", batch)) == []
+
+    # Ingredient drops: cost 2*30 + 30 = 90, margin 67%
+    batch = prices([market(11, 30)])
+    cache.put("Mana", batch)
+    alerts = watchlist.on_prices("Mana", batch, cache)
+    assert [(alert.rule_id, alert.triggered, round(alert.profit_perc, 2)) for alert in alerts] == [(1, True, 0.67)]
+    assert json.loads((tmp_path / "alerts.jsonl").read_text())["item_id"] == 10
+
+    # Still met: no repeat alert. Velocity falling below goal un-triggers it
+    batch = prices([market(10, 160, hq_velocity=10.0)])
+    cache.put("Mana", batch)
+    alerts = watchlist.on_prices("Mana", batch, cache)
+    assert [(alert.rule_id, alert.triggered) for alert in alerts] == [(1, False)]
+    assert len((tmp_path / "alerts.jsonl").read_text().splitlines()) == 2
+
+
+def test_rule_waits_for_all_prices(tmp_path, recipes_df):
+    store = WatchlistStore(str(tmp_path / "watchlist.duckdb"))
+    store.add_rule(1, "Mana", "Anima", 0.25, 40)
+    watchlist = Watchlist(store, recipes_df, sinks=[])
+    cache = PriceCache()
+
+    batch = prices([market(11, 30), market(12, 100)])
+    cache.put("Mana", batch)
+    assert watchlist.on_prices("Mana", batch, cache) == []
+    assert store.rules()[0].last_state is None  # Sell price on Anima not cached yet
+
+    batch = prices([market(10, 150)])
+    cache.put("Anima", batch)
+    assert [alert.triggered for alert in watchlist.on_prices("Anima", batch, cache)] == [True]
+
+
+def test_prefetcher_keeps_rules_warm_and_evaluates_them(tmp_path, recipes_df, monkeypatch):
+    from tests.test_prefetch import FakeSession
+    from utils import universalis
+    from utils.prefetch import PopularityTracker, Prefetcher, build_recipe_item_map
+
+    store = WatchlistStore(str(tmp_path / "watchlist.duckdb"))
+    watchlist = Watchlist(store, recipes_df, sinks=[])
+    store.add_rule(1, "Mana", None, 0.0, 1)  # Added (e.g. by another worker) after the watchlist was built
+    session, cache = FakeSession(), PriceCache()
+    prefetcher = Prefetcher(PopularityTracker(), cache, build_recipe_item_map(recipes_df), lambda: session,
+                            min_call_interval=0, watchlist=watchlist)
+
+    monkeypatch.setattr(universalis.time, "sleep", lambda _: None)
+    assert prefetcher.run_once() == 3  # Nobody has visited the page; the rule alone keeps it warm
+    # Cost 2*111 + 30 (shop) = 252; result sells for 110 HQ
+    assert store.rules()[0].last_state is False
+
+
+def test_only_lock_owner_evaluates(tmp_path, recipes_df):
+    store = WatchlistStore(str(tmp_path / "watchlist.duckdb"))
+    store.add_rule(1, "Mana", None, 0.25, 40)
+    lock_path = str(tmp_path / "watchlist.lock")
+    owner = Watchlist(store, recipes_df, sinks=[], owner=OwnerLock(lock_path))
+    other = Watchlist(store, recipes_df, sinks=[], owner=OwnerLock(lock_path))
+    assert owner.requests() == [(10, "Mana", None)]
+    assert other.requests() == []
+
+    cache = PriceCache()
+    batch = prices([market(10, 150), market(11, 30), market(12, 100)])
+    cache.put("Mana", batch)
+    assert other.on_prices("Mana", batch, cache) == []
+    assert [alert.triggered for alert in owner.on_prices("Mana", batch, cache)] == [True]
+
+    # The owner's worker exits: the next reload elsewhere takes over
+    owner.owner._file.close()
+    other.reload()
+    assert other.requests() == [(10, "Mana", None)]
+
+
+def test_new_rule_is_evaluated_without_a_price_change(tmp_path, recipes_df):
+    store = WatchlistStore(str(tmp_path / "watchlist.duckdb"))
+    watchlist = Watchlist(store, recipes_df, sinks=[])
+    cache = PriceCache()
+    batch = prices([market(10, 150), market(11, 30), market(12, 100)])
+    cache.put("Mana", batch)
+    assert watchlist.on_prices("Mana", batch, cache) == []  # No rules yet; prices fingerprinted
+
+    store.add_rule(1, "Mana", None, 0.25, 40)
+    watchlist.reload()
+    assert [alert.triggered for alert in watchlist.evaluate_pending(cache)] == [True]
+    assert watchlist.evaluate_pending(cache) == []
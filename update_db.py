@@ -9,6 +9,9 @@ import polars as pl
 import os
 from dotenv import load_dotenv
 from utils import utils
+from utils import snapshot
+from utils.icons import download_icons
+from utils.db import build_path, remove_database, swap_database, validate_database
 
 load_dotenv(dotenv_path='./.env')
 GH_TOKEN  = os.getenv("GH_TOKEN")
@@ -141,33 +144,81 @@ def update_csv(files: List[str]) -> List[str]:
     return updated_csv
 
 def update_duckdb() -> None:  
-    with duckdb.connect(DB_NAME) as db:
-        for file in csv_files:
-            filename = os.path.splitext(file)[0]
-            logger.debug(f"Processing {filename} for database update")
-            
-            df = pl.read_csv(
-                fr"csv/{file}", 
-                skip_rows=1, 
-                skip_rows_after_header=1
-            )
-            df = df.select(pl.all().name.map(lambda col_name: col_name.replace('{', '_').replace('[', '_').replace('}', '').replace(']', '')))
-
-            db.execute(fr"CREATE SCHEMA IF NOT EXISTS imported")
-            db.execute(fr"CREATE OR REPLACE TABLE imported.{filename} AS SELECT * FROM df")
-            logger.info(f"Updated imported.{filename} table in database")
-
-        with open("recipe_price.sql", "r") as f:
-            query = f.read()
-            df = db.sql(query).pl()
-            db.execute(fr"CREATE OR REPLACE TABLE main.recipe_price AS SELECT * FROM df")
-            logger.info("Created main.recipe_price table")
-
-        with open("world_dc.sql", "r") as f:
-            query = f.read()
-            df = db.sql(query).pl()
-            db.execute(fr"CREATE OR REPLACE TABLE main.world_dc AS SELECT * FROM df")
-            logger.info("Created main.world_dc table")
+    """Rebuild the database into a fresh file, validate it, then atomically swap it into place.
+    
+    The live database is never written to, so app processes reading it are never blocked
+    and never see a half-updated state; they pick up the new file on their next load.
+    
+    Raises:
+        ValueError: If the rebuilt database fails validation (the live database is left untouched)
+    """
+    new_db = build_path(DB_NAME)
+    remove_database(new_db)
+    with duckdb.connect(new_db) as db:
+        build_tables(db)
+        try:
+            counts = validate_database(db, DB_NAME)
+        except ValueError as e:
+            logger.error(f"New database failed validation, keeping current database: {e}")
+            raise
+        logger.info(f"Validated new database: {counts}")
+        export_snapshots(db)
+
+    swap_database(new_db, DB_NAME)
+    logger.info(f"Swapped new database into {DB_NAME}")
+
+def build_tables(db: duckdb.DuckDBPyConnection) -> None:
+    """Import CSVs and create the app tables in the given database.
+    
+    Args:
+        db: Open connection to the database being built
+    """
+    for file in csv_files:
+        filename = os.path.splitext(file)[0]
+        logger.debug(f"Processing {filename} for database update")
+        
+        df = pl.read_csv(
+            fr"csv/{file}", 
+            skip_rows=1, 
+            skip_rows_after_header=1
+        )
+        df = df.select(pl.all().name.map(lambda col_name: col_name.replace('{', '_').replace('[', '_').replace('}', '').replace(']', '')))
+
+        db.execute(fr"CREATE SCHEMA IF NOT EXISTS imported")
+        db.execute(fr"CREATE OR REPLACE TABLE imported.{filename} AS SELECT * FROM df")
+        logger.info(f"Updated imported.{filename} table in database")
+
+    with open("recipe_price.sql", "r") as f:
+        query = f.read()
+        df = db.sql(query).pl()
+        db.execute(fr"CREATE OR REPLACE TABLE main.recipe_price AS SELECT * FROM df")
+        logger.info("Created main.recipe_price table")
+
+    with open("world_dc.sql", "r") as f:
+        query = f.read()
+        df = db.sql(query).pl()
+        db.execute(fr"CREATE OR REPLACE TABLE main.world_dc AS SELECT * FROM df")
+        logger.info("Created main.world_dc table")
+
+def export_snapshots(db: duckdb.DuckDBPyConnection) -> None:
+    """Write app tables as Arrow IPC snapshots for workers to memory-map.
+    
+    Args:
+        db: Open connection to the database holding the app tables
+    """
+    for table in snapshot.SNAPSHOT_TABLES:
+        df = db.sql(fr"SELECT * FROM main.{table}").pl()
+        if table == "recipe_price":
+            # Precompute selectbox labels so the app doesn't need to copy the mapped table
+            df = utils.add_selectbox_label(df)
+        path = snapshot.write_snapshot(df, table)
+        logger.info(f"Wrote {table} snapshot to {path}")
+
+def update_icons() -> None:
+    """Download any item icons referenced in recipe_price that are not yet in the local icon store."""
+    with duckdb.connect(DB_NAME, read_only=True) as db:
+        icons = db.sql("SELECT DISTINCT item_icon FROM main.recipe_price").pl()["item_icon"]
+    download_icons(icons)
 
 def main():
     """Main function to update database with latest FFXIV data."""
@@ -176,9 +227,16 @@ def main():
     if db_update_required:
         update_duckdb()  # Pass list of files to write to DuckDB
         logger.info("Database update completed successfully")
+    elif not snapshot.snapshots_exist():
+        with duckdb.connect(DB_NAME, read_only=True) as db:
+            export_snapshots(db)
+        logger.info("No database updates needed; wrote missing snapshots")
     else:
         logger.info("No database updates needed")
 
+    # The nightly workflow commits new icons with the databases, so the deployed app receives them
+    update_icons()
+
 if __name__ == "__main__":
     main()
 
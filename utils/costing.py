@@ -0,0 +1,126 @@
+"""Incremental craft-cost propagation over the recipe ingredient graph"""
+
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+import polars as pl
+
+from utils.planner import build_ingredient_matrix
+
+MAX_PROPAGATION_DEPTH = 16  # Guards against cycles in the recipe graph
+
+
+class CostEngine:
+    """Keeps craft costs for every recipe up to date as individual item prices change.
+
+    The sparse ingredient matrix and a reverse-dependency index (item -> recipes using it) are
+    built once from recipe_price. When prices change, only recipes using those items are
+    repriced, in one vectorised polars pass per level; if that changes the effective cost of
+    their result item (the cheaper of buying it or crafting it when `use_subcrafts` is set),
+    the recipes using that item are repriced next, and so on up the graph.
+    """
+
+    def __init__(self, all_recipes_df: pl.DataFrame, prices: Optional[Dict[int, Optional[float]]] = None, use_subcrafts: bool = True):
+        self.matrix, self.results = build_ingredient_matrix(all_recipes_df)
+        self.matrix = self.matrix.with_columns(pl.col("recipe_id").cast(pl.Int64), pl.col("item_id").cast(pl.Int64))
+        self.use_subcrafts = use_subcrafts
+
+        self.recipes_using: Dict[int, Set[int]] = defaultdict(set)
+        for recipe_id, item_id in self.matrix.select("recipe_id", "item_id").iter_rows():
+            self.recipes_using[item_id].add(recipe_id)
+        self.recipes_making: Dict[int, Set[int]] = defaultdict(set)
+        self.result_of: Dict[int, tuple] = {}
+        for recipe_id, result_id, result_amount in self.results.iter_rows():
+            self.recipes_making[result_id].add(recipe_id)
+            self.result_of[recipe_id] = (result_id, result_amount)
+
+        self.buy_price: Dict[int, Optional[float]] = dict(prices or {})
+        self.unit_cost: Dict[int, Optional[float]] = dict(self.buy_price)
+        self.recipe_cost: Dict[int, Optional[float]] = {}
+        self.recipe_cost.update(self._compute_costs(self.result_of.keys()))
+        self._propagate(set(self.recipes_making))
+
+    def _compute_costs(self, recipe_ids: Iterable[int]) -> Dict[int, Optional[float]]:
+        """Vectorised craft cost for the given recipes; null if any ingredient has no price."""
+        recipes = pl.Series("recipe_id", list(recipe_ids), dtype=pl.Int64)
+        edges = self.matrix.filter(pl.col("recipe_id").is_in(recipes.implode()))
+        costs = pl.Series("unit_cost", [self.unit_cost.get(id) for id in edges["item_id"]], dtype=pl.Float64)
+        df = (
+            edges.with_columns(costs)
+            .group_by("recipe_id")
+            .agg(
+                pl.when(pl.col("unit_cost").null_count() == 0)
+                .then((pl.col("amount") * pl.col("unit_cost")).sum())
+                .alias("craft_cost")
+            )
+        )
+        return dict(df.iter_rows())
+
+    def _effective_cost(self, item_id: int) -> Optional[float]:
+        candidates = [self.buy_price.get(item_id)]
+        if self.use_subcrafts:
+            for recipe_id in self.recipes_making.get(item_id, ()):
+                cost = self.recipe_cost.get(recipe_id)
+                if cost is not None:
+                    candidates.append(cost / self.result_of[recipe_id][1])
+        candidates = [cost for cost in candidates if cost is not None]
+        return min(candidates) if candidates else None
+
+    def _propagate(self, items: Set[int]) -> Set[int]:
+        """Recompute effective costs of `items`, repricing dependent recipes level by level.
+
+        Returns:
+            IDs of recipes whose craft cost changed
+        """
+        changed_recipes: Set[int] = set()
+        for _ in range(MAX_PROPAGATION_DEPTH):
+            changed_items = set()
+            for item_id in items:
+                cost = self._effective_cost(item_id)
+                if cost != self.unit_cost.get(item_id):
+                    self.unit_cost[item_id] = cost
+                    changed_items.add(item_id)
+            if not changed_items:
+                break
+
+            recipes = set().union(*(self.recipes_using.get(id, ()) for id in changed_items))
+            new_costs = self._compute_costs(recipes)
+            repriced = {id for id, cost in new_costs.items() if cost != self.recipe_cost.get(id)}
+            self.recipe_cost.update({id: new_costs[id] for id in repriced})
+            changed_recipes |= repriced
+            items = {self.result_of[id][0] for id in repriced}
+        return changed_recipes
+
+    def set_prices(self, prices: Dict[int, Optional[float]]) -> Set[int]:
+        """Update buy prices and reprice only the recipes (and ancestor recipes) affected.
+
+        Returns:
+            IDs of recipes whose craft cost changed
+        """
+        self.buy_price.update(prices)
+        return self._propagate(set(prices))
+
+    def affected_recipes(self, item_ids: Iterable[int]) -> Set[int]:
+        """Recipes that use any of the items, directly or through subcrafts."""
+        affected: Set[int] = set()
+        items = set(item_ids)
+        for _ in range(MAX_PROPAGATION_DEPTH):
+            recipes = set().union(*(self.recipes_using.get(id, ()) for id in items)) - affected
+            if not recipes:
+                break
+            affected |= recipes
+            items = {self.result_of[id][0] for id in recipes}
+        return affected
+
+    def costs(self, recipe_ids: Optional[Iterable[int]] = None) -> pl.DataFrame:
+        """Current craft cost (total and per result unit) for the given or all recipes."""
+        ids = list(self.result_of) if recipe_ids is None else list(recipe_ids)
+        return pl.DataFrame(
+            {
+                "recipe_id": ids,
+                "result_id": [self.result_of[id][0] for id in ids],
+                "result_amount": [self.result_of[id][1] for id in ids],
+                "craft_cost": [self.recipe_cost.get(id) for id in ids],
+            },
+            schema={"recipe_id": pl.Int64, "result_id": pl.Int64, "result_amount": pl.Int64, "craft_cost": pl.Float64},
+        ).with_columns((pl.col("craft_cost") / pl.col("result_amount")).alias("unit_craft_cost"))
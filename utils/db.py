@@ -0,0 +1,201 @@
+"""Helpers for building, validating and atomically swapping the local DuckDB database"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence
+
+import duckdb
+import polars as pl
+
+# Columns the app relies on, per table
+EXPECTED_COLUMNS: Dict[str, List[str]] = {
+    "recipe_price": ["recipe_id", "job", "item_id", "item_amount", "recipe_part", "item_name", "item_icon", "shop_price"],
+    "world_dc": ["world_id", "world", "datacentre", "region"],
+}
+MIN_ROW_RATIO = 0.5  # A rebuild may not shrink a table below this fraction of the live table
+POOL_SIZE = 8  # Cursors per pool; bounds concurrent queries per process
+POOL_TIMEOUT = 30  # Seconds to wait for a free cursor
+WRITE_LOCK_TIMEOUT = 5  # Seconds to wait for another process to release a writable database
+
+# Named parameterised queries run through ConnectionPool.query; recipe_price is sorted by
+# (recipe_id, recipe_part), so zone maps let DuckDB skip most row groups for recipe lookups
+QUERIES: Dict[str, str] = {
+    "recipe_by_id": "SELECT * FROM main.recipe_price WHERE recipe_id = $recipe_id ORDER BY recipe_part",
+    "worlds_by_dc": "SELECT * FROM main.world_dc WHERE lower(datacentre) = lower($datacentre) ORDER BY world",
+}
+
+
+def build_path(db_path: str) -> str:
+    """Path a fresh database is built at before being swapped into place."""
+    return f"{db_path}.build"
+
+
+def remove_database(db_path: str) -> None:
+    for path in (db_path, f"{db_path}.wal"):
+        Path(path).unlink(missing_ok=True)
+
+
+def table_row_counts(db: duckdb.DuckDBPyConnection) -> Dict[str, int]:
+    return {table: db.sql(f"SELECT count(*) FROM main.{table}").fetchone()[0] for table in EXPECTED_COLUMNS}
+
+
+def validate_database(db: duckdb.DuckDBPyConnection, live_db_path: str) -> Dict[str, int]:
+    """Check a freshly built database has every app table, the expected columns and sane row counts.
+
+    Args:
+        db: Connection to the newly built database
+        live_db_path: Path of the database currently served, used to catch tables that shrank
+
+    Returns:
+        Row count per table
+
+    Raises:
+        ValueError: If a table is missing, lacks columns, is empty or shrank too much
+    """
+    tables = {row[0] for row in db.sql("SELECT table_name FROM information_schema.tables WHERE table_schema = 'main'").fetchall()}
+    for table, expected in EXPECTED_COLUMNS.items():
+        if table not in tables:
+            raise ValueError(f"Table main.{table} missing from new database")
+        columns = db.sql(f"SELECT * FROM main.{table} LIMIT 0").columns
+        missing = [col for col in expected if col not in columns]
+        if missing:
+            raise ValueError(f"Table main.{table} missing columns: {missing}")
+
+    counts = table_row_counts(db)
+    live_counts = {}
+    if Path(live_db_path).exists():
+        try:
+            with duckdb.connect(live_db_path, read_only=True) as live_db:
+                live_counts = table_row_counts(live_db)
+        except duckdb.Error:
+            # Live database is unreadable or lacks tables, so there is nothing to compare against
+            live_counts = {}
+    for table, count in counts.items():
+        if count == 0:
+            raise ValueError(f"Table main.{table} is empty")
+        if count < live_counts.get(table, 0) * MIN_ROW_RATIO:
+            raise ValueError(f"Table main.{table} shrank from {live_counts[table]} to {count} rows")
+    return counts
+
+
+def swap_database(new_db_path: str, db_path: str) -> None:
+    """Atomically replace the live database with a newly built one.
+
+    Readers holding the old file keep reading it until they reconnect; new connections see the
+    new file. The rename is atomic as both paths are in the same directory.
+    """
+    # A stale write-ahead log must never be replayed onto the new file
+    Path(f"{db_path}.wal").unlink(missing_ok=True)
+    os.replace(new_db_path, db_path)
+
+
+def connect_writable(db_path: str, timeout: float = WRITE_LOCK_TIMEOUT) -> duckdb.DuckDBPyConnection:
+    """Open a writable connection, waiting while another process holds the file's write lock.
+
+    DuckDB allows one writing process per file, so small app-owned databases are opened briefly
+    per operation and app workers take turns.
+
+    Raises:
+        duckdb.IOException: If the lock is still held after `timeout` seconds
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return duckdb.connect(db_path)
+        except duckdb.IOException as e:
+            if "lock" not in str(e).lower() or time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def db_generation(db_path: str) -> int:
+    """Identifier that changes whenever a new database is swapped in (0 if there is none)."""
+    try:
+        stat = os.stat(db_path)
+    except FileNotFoundError:
+        return 0
+    return stat.st_ino ^ stat.st_mtime_ns
+
+
+class ConnectionPool:
+    """Process-wide pool of read-only cursors on one DuckDB database, serving named queries.
+
+    All cursors share a single database instance (and its buffer cache), so a query costs a
+    cursor checkout instead of opening the file. A DuckDB connection must not be used by two
+    threads at once, so each query holds its cursor exclusively. The pool keeps reading the
+    file it opened; use `get_pool`, which replaces it when `db_generation` changes.
+    """
+
+    def __init__(self, db_path: str, size: int = POOL_SIZE, queries: Dict[str, str] = QUERIES, setup: Sequence[str] = ()):
+        self.db_path = db_path
+        self.generation = db_generation(db_path)
+        self.queries = queries
+        self.size = size
+        self.closed = False
+        self._con = duckdb.connect(db_path, read_only=True)
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        for _ in range(size):
+            cur = self._con.cursor()
+            # Session settings (e.g. TimeZone) are per cursor
+            for statement in setup:
+                cur.execute(statement)
+            self._idle.put(cur)
+
+    @contextmanager
+    def cursor(self, timeout: float = POOL_TIMEOUT) -> Iterator[duckdb.DuckDBPyConnection]:
+        if self.closed:
+            raise RuntimeError(f"Connection pool for {self.db_path} is closed")
+        try:
+            cur = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No free connection to {self.db_path} after {timeout}s")
+        try:
+            yield cur
+        finally:
+            self._idle.put(cur)
+
+    def query(self, name: str, **params) -> pl.DataFrame:
+        """Run a named query from `queries` with its parameters bound by name.
+
+        Raises:
+            KeyError: If there is no query with that name
+        """
+        sql = self.queries[name]
+        with self.cursor() as cur:
+            return cur.execute(sql, params).pl()
+
+    def close(self, timeout: float = POOL_TIMEOUT) -> None:
+        """Close every cursor, waiting up to `timeout` seconds for queries in flight to finish."""
+        self.closed = True
+        deadline = time.monotonic() + timeout
+        for _ in range(self.size):
+            try:
+                self._idle.get(timeout=max(0.0, deadline - time.monotonic())).close()
+            except queue.Empty:
+                break
+        self._con.close()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str, queries: Dict[str, str] = QUERIES, setup: Sequence[str] = ()) -> ConnectionPool:
+    """The process's pool for `db_path`, reopened if a new database has been swapped in.
+
+    DuckDB hands every connection to a path the database instance already open in the process,
+    while any connection to it remains. The previous generation's pool is therefore closed before
+    the new one opens; otherwise the new pool, and any other connection to the path, would keep
+    reading the replaced file. `queries` and `setup` apply when a pool is opened.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None or pool.generation != db_generation(db_path):
+            if pool is not None:
+                pool.close()
+            pool = _pools[db_path] = ConnectionPool(db_path, queries=queries, setup=setup)
+        return pool
@@ -0,0 +1,331 @@
+"""Time-series store of market price observations, downsampled to hourly and daily OHLC bars"""
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List, Optional
+
+import duckdb
+import polars as pl
+
+from utils import utils
+from utils.db import build_path, connect_writable, get_pool, remove_database, swap_database
+from utils.metrics import METRICS
+
+logger = utils.setup_logger(__name__)
+
+HISTORY_DB_NAME = "price_history.duckdb"
+HISTORY_SNAPSHOT_NAME = "price_history_snapshot.duckdb"  # Read-only copy served to pages
+RAW_RETENTION = timedelta(days=2)  # Every observation
+HOURLY_RETENTION = timedelta(days=60)
+DAILY_RETENTION = timedelta(days=730)
+FLUSH_ROWS = 500  # Buffered observations written in one insert
+FLUSH_INTERVAL = 60  # Seconds before a partial buffer is written anyway
+COMPACT_INTERVAL = 900  # Seconds between downsampling/retention passes
+EXPORT_INTERVAL = 300  # Seconds between read-only snapshots for charts
+
+BAR_SCHEMA = {
+    "bucket": pl.Datetime("us", "UTC"),
+    "hq": pl.Boolean,
+    "open": pl.Float64,
+    "high": pl.Float64,
+    "low": pl.Float64,
+    "close": pl.Float64,
+    "velocity": pl.Float64,
+    "samples": pl.Int32,
+}
+
+RAW_SCHEMA = {
+    "observed_at": pl.Datetime("us", "UTC"),
+    "item_id": pl.Int64,
+    "region": pl.String,
+    "hq": pl.Boolean,
+    "price": pl.Float64,
+    "velocity": pl.Float64,
+    "world": pl.String,
+}
+
+
+def raw_bars(since: str) -> str:
+    """Raw rows from SQL expression `since` onwards as single-sample bars, so every level rolls up alike."""
+    return f"""SELECT observed_at AS ts, item_id, region, hq, price AS open, price AS high, price AS low,
+                      price AS close, velocity, 1 AS samples
+               FROM price_raw WHERE observed_at >= {since}"""
+
+
+def hourly_bars(since: str) -> str:
+    return f"""SELECT bucket AS ts, item_id, region, hq, open, high, low, close, velocity, samples
+               FROM price_hourly WHERE bucket >= {since}"""
+
+
+def rollup_sql(source: str, unit: str) -> str:
+    """OHLC bars per `unit` (hour/day) from a source of bars; velocity is sample-weighted."""
+    return f"""
+        SELECT date_trunc('{unit}', ts) AS bucket, item_id, region, hq,
+            arg_min(open, ts) FILTER (WHERE open IS NOT NULL) AS open,
+            max(high) AS high,
+            min(low) AS low,
+            arg_max(close, ts) FILTER (WHERE close IS NOT NULL) AS close,
+            sum(velocity * samples) / sum(samples) FILTER (WHERE velocity IS NOT NULL) AS velocity,
+            sum(samples)::INTEGER AS samples
+        FROM ({source})
+        GROUP BY ALL"""
+
+
+def watermark(level: str) -> str:
+    """SQL expression for a level's compaction watermark (the epoch before any compaction)."""
+    return f"coalesce((SELECT compacted_until FROM compaction WHERE level = '{level}'), TIMESTAMPTZ '1970-01-01 00:00:00+00')"
+
+
+def bars_sql(resolution: str) -> str:
+    """Bars for one item in one region at a resolution, oldest first.
+
+    Hourly and daily bars include the not-yet-compacted tail, rolled up on the fly from the
+    finer levels.
+    """
+    # Raw rows not yet compacted, as hourly bars
+    recent_hours = rollup_sql(raw_bars(watermark("hourly")), "hour")
+    if resolution == "raw":
+        source = f"SELECT ts AS bucket, * EXCLUDE (ts) FROM ({raw_bars('$start')})"
+    elif resolution == "hourly":
+        source = f"SELECT * FROM price_hourly WHERE bucket >= $start UNION ALL {recent_hours}"
+    else:
+        hours = f"{hourly_bars(watermark('daily'))} UNION ALL SELECT bucket AS ts, * EXCLUDE (bucket) FROM ({recent_hours})"
+        source = f"SELECT * FROM price_daily WHERE bucket >= $start UNION ALL {rollup_sql(hours, 'day')}"
+    return f"""SELECT bucket, hq, open, high, low, close, velocity, samples
+               FROM ({source})
+               WHERE item_id = $item_id AND lower(region) = lower($region)
+                 AND bucket >= $start AND bucket <= $end AND ($hq IS NULL OR hq = $hq)
+               ORDER BY bucket, hq"""
+
+
+# Named queries served from the read-only snapshot (see PriceHistory.export_snapshot)
+HISTORY_QUERIES = {f"bars_{resolution}": bars_sql(resolution) for resolution in ("raw", "hourly", "daily")}
+
+
+def resolution_for(start: datetime, now: datetime) -> str:
+    """Finest level still retained for the whole range, keeping a chart to a few hundred points."""
+    if now - start <= RAW_RETENTION:
+        return "raw"
+    if now - start <= HOURLY_RETENTION:
+        return "hourly"
+    return "daily"
+
+
+def truncate(moment: datetime, unit: str) -> datetime:
+    """Start of the UTC hour or day containing `moment`."""
+    moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if unit == "day" else moment
+
+
+class PriceHistory:
+    """Columnar price history in DuckDB: raw observations, hourly and daily bars.
+
+    Observations are buffered in memory; a background thread (see `start`) inserts them in
+    batches and periodically runs `compact`, so pages only ever append to the buffer. Compaction
+    rolls raw rows up into hourly bars and hourly bars into daily bars, then drops rows past each
+    level's retention, so each table stays bounded by retention x items however long the app
+    runs. Every connection is short-lived, so app workers share the file.
+
+    Pages never take the file's write lock to read: the thread also exports a read-only
+    snapshot every `export_interval`, which `history` reads through a connection pool.
+    """
+
+    def __init__(self, db_path: str = HISTORY_DB_NAME, snapshot_path: Optional[str] = None, flush_rows: int = FLUSH_ROWS,
+                 flush_interval: float = FLUSH_INTERVAL, compact_interval: float = COMPACT_INTERVAL,
+                 export_interval: float = EXPORT_INTERVAL):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path or str(Path(db_path).with_name(HISTORY_SNAPSHOT_NAME))
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.export_interval = export_interval
+        self._last_export = float("-inf")
+        self._lock = threading.Lock()
+        self._buffer: List[pl.DataFrame] = []
+        self._buffered_rows = 0
+        self._last_compact = time.monotonic()
+        self._flush_due = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        with self._connect() as db:
+            # inserted_at lets compaction find rows that arrived after their hour was rolled up
+            db.execute("""CREATE TABLE IF NOT EXISTS price_raw (
+                observed_at TIMESTAMPTZ, item_id INTEGER, region VARCHAR, hq BOOLEAN,
+                price DOUBLE, velocity DOUBLE, world VARCHAR, inserted_at TIMESTAMPTZ)""")
+            for table in ("price_hourly", "price_daily"):
+                db.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TIMESTAMPTZ, item_id INTEGER, region VARCHAR, hq BOOLEAN,
+                    open DOUBLE, high DOUBLE, low DOUBLE, close DOUBLE, velocity DOUBLE, samples INTEGER,
+                    PRIMARY KEY (item_id, region, hq, bucket))""")
+            db.execute("CREATE TABLE IF NOT EXISTS compaction (level VARCHAR PRIMARY KEY, compacted_until TIMESTAMPTZ)")
+        atexit.register(self.flush)
+
+    def _connect(self) -> duckdb.DuckDBPyConnection:
+        db = connect_writable(self.db_path)
+        db.execute("SET TimeZone = 'UTC'")
+        return db
+
+    def record(self, region: str, prices_df: pl.DataFrame, observed_at: Optional[datetime] = None) -> None:
+        """Buffer one fetch's market rows (see utils.universalis.PRICE_SCHEMA) as NQ and HQ observations."""
+        observed_at = observed_at or datetime.now(timezone.utc)
+        df = pl.concat([
+            prices_df.select(
+                pl.lit(observed_at).alias("observed_at"),
+                "item_id",
+                pl.lit(region).alias("region"),
+                pl.lit(hq).alias("hq"),
+                pl.col(f"{prefix}_price").alias("price"),
+                pl.col(f"{prefix}_velocity").alias("velocity"),
+                pl.col(f"{prefix}_world").alias("world"),
+            ).cast(RAW_SCHEMA)
+            for prefix, hq in (("nq", False), ("hq", True))
+        ]).filter(pl.col("price").is_not_null() | pl.col("velocity").is_not_null())
+        with self._lock:
+            self._buffer.append(df)
+            self._buffered_rows += len(df)
+            if self._buffered_rows >= self.flush_rows:
+                self._flush_due.set()
+
+    def _write_buffer(self) -> int:
+        with self._lock:
+            frames, self._buffer, self._buffered_rows = self._buffer, [], 0
+        if not frames:
+            return 0
+        df = pl.concat(frames)
+        with self._connect() as db:
+            db.execute("INSERT INTO price_raw SELECT *, current_timestamp AS inserted_at FROM df")
+        return len(df)
+
+    def flush(self) -> int:
+        """Write buffered observations. Returns rows written."""
+        try:
+            return self._write_buffer()
+        except duckdb.Error as e:
+            # History is best effort; losing a batch must not stop the app
+            logger.warning(f"Could not write price history: {e}")
+            return 0
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._flush_due.wait(self.flush_interval)
+            self._flush_due.clear()
+            self.flush()
+            if self._stop.is_set():
+                break
+            try:
+                if time.monotonic() - self._last_compact >= self.compact_interval:
+                    self._last_compact = time.monotonic()
+                    self.compact()
+                    self._last_export = float("-inf")
+                if time.monotonic() - self._last_export >= self.export_interval:
+                    self._last_export = time.monotonic()
+                    self.export_snapshot()
+            except duckdb.Error as e:
+                logger.warning(f"Price history compaction or export failed: {e}")
+
+    def start(self) -> "PriceHistory":
+        """Flush every `flush_interval` (sooner once `flush_rows` are buffered) and compact every `compact_interval`."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="price-history", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._flush_due.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def compact(self, now: Optional[datetime] = None) -> None:
+        """Roll completed hours/days up into bars and apply retention to every level.
+
+        Besides hours completed since the last pass, every hour that received raw rows since
+        the last pass is rebuilt, so observations flushed late (by another worker, or after a
+        database error) still reach their bars. Retention drops whole hours/days, so a rebuilt
+        bar always sees all of its rows; late observations already past raw retention are dropped.
+        """
+        now = now or datetime.now(timezone.utc)
+        self._write_buffer()
+        until, day_until = truncate(now, "hour"), truncate(now, "day")
+        raw_floor, hourly_floor = truncate(now - RAW_RETENTION, "hour"), truncate(now - HOURLY_RETENTION, "day")
+        with METRICS.span("history_compact"), self._connect() as db:
+            watermarks = self._watermarks(db)
+            ingested = db.sql("SELECT max(inserted_at) AS ingested FROM price_raw").pl()["ingested"][0]
+            # Hours never compacted roll up however old they are; late rows only within raw retention
+            db.execute("""CREATE OR REPLACE TEMP TABLE touched_hour AS
+                          SELECT DISTINCT date_trunc('hour', observed_at) AS bucket FROM price_raw
+                          WHERE (observed_at >= $hourly OR (inserted_at > $ingested AND observed_at >= $floor))
+                            AND observed_at < $until""",
+                       {"hourly": watermarks["hourly"], "ingested": watermarks["ingested"], "floor": raw_floor, "until": until})
+            db.execute(f"""INSERT OR REPLACE INTO price_hourly SELECT * FROM ({rollup_sql(raw_bars("$since"), "hour")})
+                           WHERE bucket IN (SELECT bucket FROM touched_hour)""",
+                       {"since": min(watermarks["hourly"], raw_floor)})
+            db.execute("""CREATE OR REPLACE TEMP TABLE touched_day AS
+                          SELECT DISTINCT date_trunc('day', bucket) AS bucket
+                          FROM (SELECT bucket FROM touched_hour UNION ALL SELECT bucket FROM price_hourly WHERE bucket >= $daily)
+                          WHERE bucket < $until""",
+                       {"daily": watermarks["daily"], "until": day_until})
+            db.execute(f"""INSERT OR REPLACE INTO price_daily SELECT * FROM ({rollup_sql(hourly_bars("$since"), "day")})
+                           WHERE bucket IN (SELECT bucket FROM touched_day)""",
+                       {"since": min(watermarks["daily"], hourly_floor)})
+
+            levels = {"hourly": until, "daily": day_until}
+            if ingested is not None:
+                levels["ingested"] = ingested
+            db.executemany("INSERT OR REPLACE INTO compaction VALUES (?, ?)", list(levels.items()))
+            db.execute("DELETE FROM price_raw WHERE observed_at < ?", [raw_floor])
+            db.execute("DELETE FROM price_hourly WHERE bucket < ?", [hourly_floor])
+            db.execute("DELETE FROM price_daily WHERE bucket < ?", [now - DAILY_RETENTION])
+            db.execute("CHECKPOINT")
+
+    @staticmethod
+    def _watermarks(db: duckdb.DuckDBPyConnection) -> dict:
+        """Per level, the time before which finer data has been rolled up into it, and the last
+        raw insert (`ingested`) the rollups have seen."""
+        # Fetched through Arrow, as DuckDB's Python conversion of TIMESTAMPTZ needs pytz
+        watermarks = dict(db.sql("SELECT level, compacted_until FROM compaction").pl().iter_rows())
+        epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+        return {level: watermarks.get(level, epoch) for level in ("hourly", "daily", "ingested")}
+
+    def export_snapshot(self) -> None:
+        """Copy the history into a fresh file and swap it in as the read-only snapshot for charts.
+
+        The copy is built and swapped while holding the history file's write lock, so exports
+        from several workers never overlap. Raw rows are sorted by item so zone maps skip most
+        of them for a single item's chart.
+        """
+        build = build_path(self.snapshot_path)
+        quoted_build = build.replace("'", "''")
+        with METRICS.span("history_export"), self._connect() as db:
+            remove_database(build)
+            db.execute(f"ATTACH '{quoted_build}' AS snapshot")
+            db.execute("CREATE TABLE snapshot.price_raw AS SELECT * FROM price_raw ORDER BY item_id, region, observed_at")
+            for table in ("price_hourly", "price_daily"):
+                db.execute(f"CREATE TABLE snapshot.{table} AS SELECT * FROM {table} ORDER BY item_id, region, bucket")
+            db.execute("CREATE TABLE snapshot.compaction AS SELECT * FROM compaction")
+            db.execute("DETACH snapshot")
+            swap_database(build, self.snapshot_path)
+
+    def history(self, item_id: int, region: str, start: datetime, end: Optional[datetime] = None,
+                hq: Optional[bool] = None, now: Optional[datetime] = None) -> pl.DataFrame:
+        """Bars for one item in one region (datacentre or world) over a time range, oldest first.
+
+        Read from the latest snapshot, so observations newer than the last export (at most
+        `export_interval` plus `flush_interval` old) are not included. The resolution is picked
+        from the range (see `resolution_for`) and the uncompacted tail is included (see `bars_sql`).
+
+        Returns:
+            bucket, hq, open, high, low, close, velocity, samples
+        """
+        if not os.path.exists(self.snapshot_path):
+            return pl.DataFrame(schema=BAR_SCHEMA)
+        now = now or datetime.now(timezone.utc)
+        pool = get_pool(self.snapshot_path, HISTORY_QUERIES, setup=["SET TimeZone = 'UTC'"])
+        return pool.query(f"bars_{resolution_for(start, now)}", item_id=item_id, region=region,
+                          start=start, end=end or now, hq=hq)
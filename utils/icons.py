@@ -0,0 +1,80 @@
+"""Local store of item icons, downloaded once at database update time and served by the app"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Optional
+
+import requests
+
+from utils import utils
+from utils.universalis import make_requests_session
+
+logger = utils.setup_logger(__name__)
+
+ICON_SOURCE_URL = os.getenv("ICON_SOURCE_URL", "https://v2.xivapi.com/api/asset")
+ICON_DIR = Path("static") / "icons"  # Streamlit serves ./static at app/static when enableStaticServing is on
+ICON_URL_PREFIX = "app/static/icons"
+DOWNLOAD_WORKERS = 8
+
+
+def icon_game_path(icon: int) -> str:
+    """Game asset path of an icon, e.g. 20651 -> ui/icon/020000/020651.tex"""
+    folder = f"{icon:0>6}"[:3] + "000"
+    return f"ui/icon/{folder}/{icon:0>6}.tex"
+
+
+def icon_relative_path(icon: int) -> str:
+    folder = f"{icon:0>6}"[:3] + "000"
+    return f"{folder}/{icon:0>6}.png"
+
+
+def local_icon_path(icon: int, directory: Path = ICON_DIR) -> Path:
+    return Path(directory) / icon_relative_path(icon)
+
+
+def remote_icon_url(icon: int, base_url: str = ICON_SOURCE_URL) -> str:
+    return f"{base_url}?path={icon_game_path(icon)}&format=png"
+
+
+def icon_url(icon: int, directory: Path = ICON_DIR) -> str:
+    """URL for an icon: the local copy if it has been downloaded, else the upstream asset API."""
+    if local_icon_path(icon, directory).is_file():
+        return f"{ICON_URL_PREFIX}/{icon_relative_path(icon)}"
+    return remote_icon_url(icon)
+
+
+def download_icon(session: requests.Session, icon: int, directory: Path = ICON_DIR, base_url: str = ICON_SOURCE_URL) -> bool:
+    """Download one icon PNG into the store; True if it was saved."""
+    path = local_icon_path(icon, directory)
+    try:
+        response = session.get(remote_icon_url(icon, base_url), timeout=30)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Could not download icon {icon}: {e}")
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".png.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(response.content)
+    os.replace(tmp_path, path)
+    return True
+
+
+def download_icons(icons: Iterable[Optional[int]], directory: Path = ICON_DIR, base_url: str = ICON_SOURCE_URL,
+                   workers: int = DOWNLOAD_WORKERS) -> int:
+    """Download every icon not already in the store.
+
+    Icons never change for a given ID, so existing files are kept and only new icons are fetched.
+
+    Returns:
+        Number of icons downloaded
+    """
+    missing = sorted({icon for icon in icons if icon is not None and not local_icon_path(icon, directory).is_file()})
+    if not missing:
+        return 0
+    session = make_requests_session()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        saved = sum(pool.map(lambda icon: download_icon(session, icon, directory, base_url), missing))
+    logger.info(f"Downloaded {saved} of {len(missing)} missing icons")
+    return saved
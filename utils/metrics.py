@@ -0,0 +1,165 @@
+"""In-process timing spans and counters, exported as Prometheus text and structured JSON logs"""
+
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from utils import utils
+
+logger = utils.setup_logger(__name__)
+
+# Histogram bucket upper bounds in seconds, from in-memory polars work up to slow API calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[dict] = None) -> str:
+    pairs = list(key) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v).replace(chr(34), "")}"' for k, v in pairs) + "}"
+
+
+class Metrics:
+    """Thread-safe registry of counters and duration histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, list]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # [bucket counts..., count, sum]
+            values = series.setdefault(key, [0] * (len(BUCKETS) + 2) + [0.0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-3] += 1
+            values[-2] += 1
+            values[-1] += seconds
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[dict]:
+        """Time a block of work, recording it under `<name>_seconds` and logging it as JSON at DEBUG.
+
+        Yields a dict the block can fill with extra fields (status, bytes, ...) for the log line.
+        """
+        fields: dict = {}
+        start = time.perf_counter()
+        error = None
+        try:
+            yield fields
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(f"{name}_seconds", elapsed, **labels)
+            record = {"span": name, **labels, **fields, "duration_ms": round(elapsed * 1000, 2)}
+            if error:
+                record["error"] = error
+            logger.debug(json.dumps(record, default=str))
+
+    def timed(self, name: str, **labels) -> Callable:
+        """Decorator form of `span`."""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        """Return all metrics as plain data, e.g. for a JSON export."""
+        with self._lock:
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [{"labels": dict(key), "count": values[-2], "sum": values[-1]} for key, values in series.items()]
+                for name, series in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, values in series.items():
+                    for bound, count in zip(BUCKETS, values):
+                        lines.append(f"{name}_bucket{_format_labels(key, {'le': bound})} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {values[-3]}")
+                    lines.append(f"{name}_count{_format_labels(key)} {values[-2]}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# Process-wide registry used by the app and helpers
+METRICS = Metrics()
+
+
+def start_metrics_server(port: int, metrics: Metrics = METRICS, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Serve `/metrics` (Prometheus text) and `/metrics.json` from a daemon thread.
+
+    The endpoint has no authentication, so it listens on loopback unless `host` says otherwise.
+
+    Returns:
+        The running server, or None if the port could not be bound (e.g. another worker owns it)
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = metrics.render_prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        logger.warning(f"Metrics server not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on {host}:{server.server_address[1]}")
+    return server
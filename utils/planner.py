@@ -0,0 +1,166 @@
+"""Shopping-list planner aggregating ingredient demand across many crafts"""
+
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import polars as pl
+import requests
+
+from utils.universalis import LISTING_SCHEMA, fetch_listings
+
+SHOP_WORLD = "Shop"  # Pseudo-world used for items bought from NPC vendors
+
+
+def build_ingredient_matrix(all_recipes_df: pl.DataFrame) -> Tuple[pl.DataFrame, pl.DataFrame]:
+    """Split recipe_price into a sparse recipe x item ingredient matrix and the recipe results.
+
+    Returns:
+        (matrix, results): matrix has one (recipe_id, item_id, amount) row per non-zero entry;
+        results has (recipe_id, result_id, result_amount)
+    """
+    matrix = (
+        all_recipes_df.filter(pl.col("recipe_part").str.contains("ingredient"))
+        .group_by("recipe_id", "item_id")
+        .agg(pl.col("item_amount").sum().alias("amount"))
+        .sort("recipe_id", "item_id")
+    )
+    results = all_recipes_df.filter(pl.col("recipe_part") == "result").select(
+        "recipe_id", pl.col("item_id").alias("result_id"), pl.col("item_amount").alias("result_amount")
+    )
+    return matrix, results
+
+
+def aggregate_demand(targets: Iterable[Tuple[int, int]], matrix: pl.DataFrame, results: pl.DataFrame) -> pl.DataFrame:
+    """Total ingredient demand for a list of (recipe_id, quantity wanted) targets.
+
+    Quantities are rounded up to whole crafts using each recipe's result amount.
+
+    Returns:
+        DataFrame of item_id and total demand
+    """
+    targets_df = (
+        pl.DataFrame(list(targets), schema={"recipe_id": pl.Int64, "quantity": pl.Int64}, orient="row")
+        .group_by("recipe_id").agg(pl.col("quantity").sum())
+        .join(results.select(pl.col("recipe_id").cast(pl.Int64), "result_amount"), on="recipe_id")
+        .with_columns(((pl.col("quantity") + pl.col("result_amount") - 1) // pl.col("result_amount")).alias("crafts"))
+    )
+    return (
+        targets_df.join(matrix.with_columns(pl.col("recipe_id").cast(pl.Int64)), on="recipe_id")
+        .group_by("item_id")
+        .agg((pl.col("crafts") * pl.col("amount")).sum().alias("demand"))
+        .sort("item_id")
+    )
+
+
+@dataclass
+class ShoppingPlan:
+    purchases: pl.DataFrame  # world, item_id, hq, price_per_unit, quantity, cost
+    shortfall: pl.DataFrame  # item_id, missing: demand no source could cover
+    total_cost: int
+
+    def by_world(self) -> pl.DataFrame:
+        """Per-world summary of item count and cost, most expensive world first."""
+        return (
+            self.purchases.group_by("world")
+            .agg(pl.col("item_id").n_unique().alias("items"), pl.col("cost").sum())
+            .sort("cost", descending=True)
+        )
+
+
+def cheapest_cover(demand: int, listings: List[Tuple[int, int]], shop_price: Optional[int]) -> Tuple[List[int], int]:
+    """Cheapest way to buy at least `demand` units from whole listings plus an unlimited vendor.
+
+    Minimises the total cost paid, so a small listing that just covers the remainder beats a
+    bigger stack that is cheaper per unit but overshoots, and the vendor beats any listing whose
+    whole price is more than buying the remainder from the vendor.
+
+    Args:
+        demand: Units wanted
+        listings: (price_per_unit, quantity) of each market listing
+        shop_price: Vendor price per unit, or None if vendors do not sell the item
+
+    Returns:
+        (indexes of the listings to buy, units to buy from the vendor). If the listings cannot
+        cover demand and there is no vendor, every listing is bought.
+    """
+    if shop_price is None and sum(quantity for _, quantity in listings) < demand:
+        return list(range(len(listings))), 0
+
+    # best[q]: cheapest listings covering at least q units (0/1 knapsack, overshoot counted as q)
+    best = [0] + [float("inf")] * demand
+    taken = []
+    for price, quantity in listings:
+        take = [False] * (demand + 1)
+        for q in range(demand, 0, -1):
+            cost = best[max(0, q - quantity)] + price * quantity
+            if cost < best[q]:
+                best[q], take[q] = cost, True
+        taken.append(take)
+
+    # Units covered by listings; the vendor buys the rest
+    if shop_price is None:
+        covered = demand
+    else:
+        covered = min(range(demand + 1), key=lambda q: (best[q] + (demand - q) * shop_price, q))
+
+    chosen, q = [], covered
+    for index in range(len(listings) - 1, -1, -1):
+        if q > 0 and taken[index][q]:
+            chosen.append(index)
+            q = max(0, q - listings[index][1])
+    return sorted(chosen), demand - covered
+
+
+def assign_purchases(demand_df: pl.DataFrame, listings_df: pl.DataFrame, shop_prices_df: pl.DataFrame) -> ShoppingPlan:
+    """Buy each item's demand at the lowest total cost (see `cheapest_cover`).
+
+    Market listings must be bought whole, so the listings taken may overshoot demand.
+    Vendor items act as an unlimited listing at the shop price.
+
+    Args:
+        demand_df: item_id and demand
+        listings_df: Market listings as returned by `fetch_listings`
+        shop_prices_df: item_id and shop_price (null if not sold by vendors)
+    """
+    shop_prices = dict(shop_prices_df.select("item_id", "shop_price").iter_rows())
+    listings_by_item = listings_df.select(list(LISTING_SCHEMA)).sort("item_id", "price_per_unit", "quantity").partition_by("item_id", as_dict=True)
+
+    rows, shortfall = [], []
+    for item_id, demand in demand_df.select("item_id", "demand").iter_rows():
+        listings = listings_by_item.get((item_id,), pl.DataFrame(schema=LISTING_SCHEMA)).rows(named=True)
+        shop_price = shop_prices.get(item_id)
+        shop_price = None if shop_price is None else int(shop_price)
+        chosen, from_shop = cheapest_cover(demand, [(row["price_per_unit"], row["quantity"]) for row in listings], shop_price)
+        rows.extend(listings[index] for index in chosen)
+        if from_shop:
+            rows.append({"item_id": item_id, "world": SHOP_WORLD, "hq": False, "price_per_unit": shop_price, "quantity": from_shop})
+        missing = demand - from_shop - sum(listings[index]["quantity"] for index in chosen)
+        if missing > 0:
+            shortfall.append((item_id, missing))
+
+    purchases = (
+        pl.DataFrame(rows, schema=LISTING_SCHEMA)
+        .with_columns((pl.col("price_per_unit") * pl.col("quantity")).alias("cost"))
+        .select("world", "item_id", "hq", "price_per_unit", "quantity", "cost")
+        .sort("world", "item_id", "price_per_unit")
+    )
+    shortfall_df = pl.DataFrame(shortfall, schema={"item_id": pl.Int64, "missing": pl.Int64}, orient="row")
+    return ShoppingPlan(purchases, shortfall_df, int(purchases["cost"].sum()))
+
+
+def plan_shopping(
+    session: requests.Session,
+    all_recipes_df: pl.DataFrame,
+    targets: Iterable[Tuple[int, int]],
+    region: str,
+) -> ShoppingPlan:
+    """Plan purchases for crafting all targets, fetching every needed item in one chunked batch."""
+    matrix, results = build_ingredient_matrix(all_recipes_df)
+    demand_df = aggregate_demand(targets, matrix, results)
+    if demand_df.is_empty():
+        empty = pl.DataFrame(schema={**LISTING_SCHEMA, "cost": pl.Int64}).select("world", "item_id", "hq", "price_per_unit", "quantity", "cost")
+        return ShoppingPlan(empty, pl.DataFrame(schema={"item_id": pl.Int64, "missing": pl.Int64}), 0)
+
+    listings_df = fetch_listings(session, demand_df["item_id"], region)
+    shop_prices_df = all_recipes_df.select("item_id", "shop_price").unique("item_id")
+    return assign_purchases(demand_df, listings_df, shop_prices_df)
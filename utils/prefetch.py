@@ -0,0 +1,172 @@
+"""Background prefetching of market data for the most requested recipes"""
+
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import polars as pl
+import requests
+
+from utils import utils
+from utils.universalis import PriceCache, chunk_ids, fetch_market_prices
+from utils.watchlist import Watchlist
+
+logger = utils.setup_logger(__name__)
+
+PREFETCH_TOP_N = 50  # Number of popular (item, dc, world) requests kept warm
+PREFETCH_INTERVAL = 15  # Seconds between prefetch passes
+POPULARITY_HALF_LIFE = 3600  # Seconds for a request's weight to halve, so post-patch trends dominate quickly
+
+Request = Tuple[int, str, Optional[str]]
+
+
+class PopularityTracker:
+    """Thread-safe, time-decayed counter of (item, dc, world) page requests."""
+
+    def __init__(self, half_life: float = POPULARITY_HALF_LIFE):
+        self.half_life = half_life
+        self._lock = threading.Lock()
+        self._scores: Dict[Request, float] = defaultdict(float)
+        self._last_decay = time.time()
+
+    def record(self, item_id: int, dc: str, world: Optional[str] = None) -> None:
+        key = (int(item_id), dc, world or None)
+        with self._lock:
+            self._scores[key] += 1
+
+    def decay(self, now: Optional[float] = None) -> None:
+        """Scale down all scores by the time elapsed since the last decay and drop negligible ones."""
+        now = time.time() if now is None else now
+        with self._lock:
+            factor = 0.5 ** ((now - self._last_decay) / self.half_life)
+            self._last_decay = now
+            for key in list(self._scores):
+                self._scores[key] *= factor
+                if self._scores[key] < 0.01:
+                    del self._scores[key]
+
+    def top(self, n: int) -> List[Request]:
+        with self._lock:
+            ranked = sorted(self._scores.items(), key=lambda kv: kv[1], reverse=True)
+        return [key for key, _ in ranked[:n]]
+
+
+def build_recipe_item_map(all_recipes_df: pl.DataFrame) -> Dict[int, List[int]]:
+    """Map each craftable item ID to every item (result and ingredients) priced on its page."""
+    results_df = all_recipes_df.filter(pl.col("recipe_part") == "result").select("recipe_id", pl.col("item_id").alias("result_id"))
+    df = (
+        all_recipes_df.select("recipe_id", "item_id")
+        .join(results_df, on="recipe_id")
+        .group_by("result_id")
+        .agg(pl.col("item_id").unique(maintain_order=True))
+    )
+    return {row["result_id"]: row["item_id"] for row in df.iter_rows(named=True)}
+
+
+class Prefetcher:
+    """Keeps the PriceCache warm for popular recipes so page views rarely wait on Universalis.
+
+    Each pass takes the top-N requests, collects the items whose cache entries are missing or
+    about to expire, and refreshes them per region in batches of up to 100 item IDs.
+    Calls are spaced at least `min_call_interval` seconds apart to respect Universalis rate limits.
+    If a watchlist is attached, its rules' recipes are kept warm too and each refreshed batch is
+    handed to it, so rules are re-evaluated off the back of fetches that happen anyway.
+    """
+
+    def __init__(
+        self,
+        tracker: PopularityTracker,
+        cache: PriceCache,
+        recipe_items: Dict[int, List[int]],
+        session_factory: Callable[[], requests.Session],
+        top_n: int = PREFETCH_TOP_N,
+        interval: float = PREFETCH_INTERVAL,
+        refresh_ahead: Optional[float] = None,
+        min_call_interval: float = 0.5,
+        watchlist: Optional[Watchlist] = None,
+    ):
+        self.tracker = tracker
+        self.cache = cache
+        self.recipe_items = recipe_items
+        self.session_factory = session_factory
+        self.top_n = top_n
+        self.interval = interval
+        # Refresh anything that would expire before the next pass finishes
+        self.refresh_ahead = refresh_ahead if refresh_ahead is not None else interval * 2
+        self.min_call_interval = min_call_interval
+        self.watchlist = watchlist
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def stale_items_by_region(self) -> Dict[str, List[int]]:
+        """Group the items of popular recipes that need refreshing by region to query."""
+        wanted: Dict[str, List[int]] = defaultdict(list)
+        page_requests = self.tracker.top(self.top_n)
+        if self.watchlist is not None:
+            page_requests = list(dict.fromkeys(page_requests + self.watchlist.requests()))
+        for item_id, dc, world in page_requests:
+            item_ids = self.recipe_items.get(item_id, [])
+            # Pages look up the datacentre for buying and, if a world is selected, that world for selling
+            for region in filter(None, (dc, world)):
+                wanted[region].extend(self.cache.expiring(region, item_ids, self.refresh_ahead))
+        return {region: list(dict.fromkeys(ids)) for region, ids in wanted.items() if ids}
+
+    def run_once(self) -> int:
+        """Run a single prefetch pass and return the number of items refreshed."""
+        self.tracker.decay()
+        if self.watchlist is not None:
+            # Rules are added and removed by any worker's pages, so re-read them every pass
+            try:
+                self.watchlist.reload()
+            except Exception as e:
+                logger.error(f"Watchlist reload failed: {e}")
+        session = self.session_factory()
+        refreshed = 0
+        for region, item_ids in self.stale_items_by_region().items():
+            for batch in chunk_ids(item_ids):
+                if self._stop.is_set():
+                    return refreshed
+                started = time.monotonic()
+                try:
+                    prices_df = fetch_market_prices(session, batch, region)
+                except requests.exceptions.RequestException as e:
+                    logger.warning(f"Prefetch of {len(batch)} items for {region} failed: {e}")
+                    continue
+                self.cache.put(region, prices_df)
+                refreshed += len(batch)
+                if self.watchlist is not None:
+                    try:
+                        self.watchlist.on_prices(region, prices_df, self.cache)
+                    except Exception as e:
+                        logger.error(f"Watchlist evaluation for {region} failed: {e}")
+                self._stop.wait(max(0.0, self.min_call_interval - (time.monotonic() - started)))
+        if self.watchlist is not None:
+            # New rules whose prices were already cached and unchanged would otherwise wait for a change
+            try:
+                self.watchlist.evaluate_pending(self.cache)
+            except Exception as e:
+                logger.error(f"Watchlist evaluation of new rules failed: {e}")
+        if refreshed:
+            logger.info(f"Prefetched market data for {refreshed} items")
+        return refreshed
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Prefetch pass failed: {e}")
+            self._stop.wait(self.interval)
+
+    def start(self) -> "Prefetcher":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="universalis-prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
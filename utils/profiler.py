@@ -0,0 +1,107 @@
+"""Sampling profiler capturing a single Streamlit script run as flame-graph stacks"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from types import FrameType
+from typing import Optional
+
+from utils import utils
+
+logger = utils.setup_logger(__name__)
+
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+MAX_DURATION = 120  # Seconds before a capture is cut off
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread until it leaves the given script's module frame.
+
+    Stopping on the script frame disappearing means the capture covers exactly one script run,
+    however it ends (normally, `st.stop()` or a rerun), without the script having to stop it.
+    Output is written as collapsed stacks (`.folded`, for flamegraph.pl/speedscope) plus a
+    `.json` file holding the request metadata and the hottest functions.
+    """
+
+    def __init__(self, root_file: str, metadata: dict, thread_id: Optional[int] = None,
+                 interval: float = SAMPLE_INTERVAL, output_dir: Path = PROFILE_DIR):
+        self.root_file = os.path.abspath(root_file)
+        self.metadata = metadata
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.output_dir = Path(output_dir)
+        self.stacks: Counter = Counter()
+        self.output_path: Optional[Path] = None
+        self._done = threading.Event()
+
+    def _sample(self) -> bool:
+        """Record the target thread's current stack; False once the script run has finished."""
+        frame = sys._current_frames().get(self.thread_id)
+        labels, in_script = [], False
+        while frame is not None:
+            if frame.f_code.co_name == "<module>" and os.path.abspath(frame.f_code.co_filename) == self.root_file:
+                in_script = True
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        if in_script:
+            self.stacks[";".join(reversed(labels))] += 1
+        return in_script
+
+    def _run(self) -> None:
+        started = time.perf_counter()
+        while time.perf_counter() - started < MAX_DURATION and self._sample():
+            time.sleep(self.interval)
+        self.metadata["duration_s"] = round(time.perf_counter() - started, 3)
+        try:
+            self.output_path = self.save()
+            logger.info(f"Saved profile to {self.output_path}")
+        except OSError as e:
+            logger.error(f"Could not save profile: {e}")
+        self._done.set()
+
+    def start(self) -> "SamplingProfiler":
+        self.metadata.setdefault("started_at", datetime.now(timezone.utc).isoformat())
+        threading.Thread(target=self._run, name="script-profiler", daemon=True).start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def top_functions(self, n: int = 25) -> list:
+        """Functions by samples spent inside them (self) and anywhere below them (total)."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+        return [{"function": label, "self": own[label], "total": count} for label, count in total.most_common(n)]
+
+    def save(self) -> Path:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        tag = "_".join(re.sub(r"[^\w-]", "", str(self.metadata.get(key))) for key in ("item", "dc", "world"))
+        stem = self.output_dir / f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}_{tag}"
+        with open(stem.with_suffix(".folded"), "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        summary = {
+            **self.metadata,
+            "samples": sum(self.stacks.values()),
+            "interval_s": self.interval,
+            "top_functions": self.top_functions(),
+        }
+        with open(stem.with_suffix(".json"), "w") as f:
+            json.dump(summary, f, indent=2, default=str)
+        return stem.with_suffix(".folded")
@@ -0,0 +1,128 @@
+"""Server-side search over craftable items, so the recipe selectbox only receives the top matches"""
+
+import bisect
+import re
+from collections import defaultdict
+from typing import Dict, List, Set
+
+import polars as pl
+
+SEARCH_LIMIT = 25  # Maximum matches sent to the browser
+MIN_TRIGRAM_SIMILARITY = 0.3  # Jaccard similarity needed for a fuzzy name match
+JOB_BOOST = 5.0  # Added when a query word is the recipe's job; less than the gap between score tiers
+
+_TOKEN_RE = re.compile(r"[\w']+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RecipeSearchIndex:
+    """Prefix and trigram index over item name, item ID and job of every craftable result.
+
+    Built once from `get_all_recipes` output; `search` returns only the best matches.
+    Scores, highest first: exact item ID, name prefix, ID prefix, all query words prefixing
+    name words, then fuzzy trigram similarity for typos. A query word that is a job
+    abbreviation matches recipes of that job, which get a small boost. If it also prefixes a
+    name word (e.g. "arm" in "Iron Armguards") it matches those names too; otherwise (e.g.
+    "bsm") it restricts matches to that job.
+    """
+
+    def __init__(self, all_recipes_df: pl.DataFrame):
+        self.df = (
+            all_recipes_df.filter(pl.col("recipe_part") == "result")
+            .select("selectbox_label", "recipe_id", "item_id", "item_name", "job")
+            .sort("recipe_id")
+        )
+        self.names = [name.lower() for name in self.df["item_name"]]
+        self.ids = [str(id) for id in self.df["item_id"]]
+        self.jobs = [job.lower() if job else "" for job in self.df["job"]]
+        self.job_rows: Dict[str, Set[int]] = defaultdict(set)
+        for row, job in enumerate(self.jobs):
+            if job:
+                self.job_rows[job].add(row)
+
+        # Sorted (token, row) pairs allow prefix lookups by bisection
+        self.tokens = sorted((token, row) for row, name in enumerate(self.names) for token in tokenize(name))
+        self.id_index = sorted((id, row) for row, id in enumerate(self.ids))
+        self.trigram_index: Dict[str, List[int]] = defaultdict(list)
+        self.name_trigrams = [trigrams(name) for name in self.names]
+        for row, grams in enumerate(self.name_trigrams):
+            for gram in grams:
+                self.trigram_index[gram].append(row)
+
+    @staticmethod
+    def _prefix_rows(pairs: list, prefix: str) -> Set[int]:
+        start = bisect.bisect_left(pairs, (prefix,))
+        rows = set()
+        for key, row in pairs[start:]:
+            if not key.startswith(prefix):
+                break
+            rows.add(row)
+        return rows
+
+    def _fuzzy_rows(self, text: str) -> Dict[int, float]:
+        grams = trigrams(text)
+        shared: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for row in self.trigram_index.get(gram, ()):
+                shared[row] += 1
+        scores = {}
+        for row, count in shared.items():
+            similarity = count / len(grams | self.name_trigrams[row])
+            if similarity >= MIN_TRIGRAM_SIMILARITY:
+                scores[row] = similarity
+        return scores
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> pl.DataFrame:
+        """Return up to `limit` matching results (selectbox_label, recipe_id, item_id), best first."""
+        words = tokenize(query)
+        if not words:
+            return self.df.head(0).select("selectbox_label", "recipe_id", "item_id")
+        job_words = {word for word in words if word in self.job_rows}
+        text = " ".join(words)
+        # The query without job words, for names of recipes matched through their job
+        name_text = " ".join(word for word in words if word not in job_words)
+
+        scores: Dict[int, float] = defaultdict(float)
+        for word in words:
+            if word.isdigit():
+                for row in self._prefix_rows(self.id_index, word):
+                    scores[row] = max(scores[row], 100.0 if self.ids[row] == word else 60.0)
+        # Every query word must prefix a word in the name, or be the recipe's job
+        name_rows = {word: self._prefix_rows(self.tokens, word) for word in words}
+        word_rows = [name_rows[word] | self.job_rows.get(word, set()) for word in words]
+        for row in set.intersection(*word_rows):
+            if self.names[row].startswith(text):
+                score = 90.0
+            elif name_text != text and self.names[row].startswith(name_text):
+                score = 80.0
+            else:
+                score = 70.0
+            # Prefer shorter names, i.e. closer matches
+            scores[row] = max(scores[row], score - len(self.names[row]) / 100)
+        if len(text) >= 3:
+            for row, similarity in self._fuzzy_rows(text).items():
+                scores[row] = max(scores[row], 50.0 * similarity)
+        if name_text != text and len(name_text) >= 3:
+            # Typos in the name of a recipe of the queried job
+            for row, similarity in self._fuzzy_rows(name_text).items():
+                if self.jobs[row] in job_words:
+                    scores[row] = max(scores[row], 50.0 * similarity)
+        for row in scores:
+            if self.jobs[row] in job_words:
+                scores[row] += JOB_BOOST
+
+        # A job word that is no name word's prefix can only mean the job
+        job_filter = {word for word in job_words if not name_rows[word]}
+        ranked = sorted(
+            (row for row in scores if not job_filter or self.jobs[row] in job_filter),
+            key=lambda row: (-scores[row], self.names[row], row),
+        )[:limit]
+        return self.df[ranked].select("selectbox_label", "recipe_id", "item_id")
@@ -0,0 +1,48 @@
+"""Arrow IPC snapshots of DuckDB tables that worker processes memory-map read-only"""
+
+import os
+from pathlib import Path
+from typing import Optional
+
+import polars as pl
+
+SNAPSHOT_DIR = Path("snapshot")
+SNAPSHOT_TABLES = ["recipe_price", "world_dc"]
+
+
+def snapshot_path(name: str, directory: Path = SNAPSHOT_DIR) -> Path:
+    return Path(directory) / f"{name}.arrow"
+
+
+def write_snapshot(df: pl.DataFrame, name: str, directory: Path = SNAPSHOT_DIR) -> Path:
+    """Write a table as an uncompressed Arrow IPC file, replacing any previous version atomically.
+
+    Compression is disabled so readers can map the buffers directly instead of decoding a copy.
+    """
+    path = snapshot_path(name, directory)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".arrow.tmp")
+    df.write_ipc(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_snapshot(name: str, directory: Path = SNAPSHOT_DIR) -> Optional[pl.DataFrame]:
+    """Memory-map a snapshot read-only, so every process shares the same OS page cache.
+
+    Returns:
+        The mapped DataFrame, or None if no snapshot has been written yet
+    """
+    path = snapshot_path(name, directory)
+    if not path.exists():
+        return None
+    import pyarrow as pa
+
+    # pyarrow maps the file and polars wraps the mapped buffers without copying them;
+    # the mapping stays open for as long as the buffers are referenced
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    return pl.from_arrow(table, rechunk=False)
+
+
+def snapshots_exist(directory: Path = SNAPSHOT_DIR) -> bool:
+    return all(snapshot_path(name, directory).exists() for name in SNAPSHOT_TABLES)
@@ -0,0 +1,239 @@
+"""Helpers for fetching market data from the Universalis REST API and caching it per item"""
+
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import polars as pl
+import requests
+
+from utils.metrics import METRICS
+
+UNIVERSALIS_URL = os.getenv("UNIVERSALIS_URL", "https://universalis.app/api/v2")
+MAX_ITEMS_PER_REQUEST = 100  # Universalis limit for multi-item lookups
+PRICE_TTL = 300  # Seconds before cached market data is considered stale
+
+MARKET_FIELDS = ["nqSaleVelocity", "hqSaleVelocity", "listings.pricePerUnit", "listings.onMannequin", "listings.worldName"]
+
+PRICE_SCHEMA = {
+    "item_id": pl.Int64,
+    "nq_price": pl.Int64,
+    "nq_velocity": pl.Float64,
+    "nq_world": pl.String,
+    "hq_price": pl.Int64,
+    "hq_velocity": pl.Float64,
+    "hq_world": pl.String,
+}
+
+
+def make_requests_session() -> requests.Session:
+    """Create a requests session with retries/backoff for transient Universalis errors."""
+    session = requests.Session()
+    try:
+        from urllib3.util import Retry
+        from requests.adapters import HTTPAdapter
+        retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(max_retries=retries)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+    except Exception:
+        pass
+    return session
+
+
+def fetch_universalis(session: requests.Session, url: str, params: dict) -> dict:
+    with METRICS.span("universalis_request", hq=params.get("hq")) as span:
+        resp = session.get(url, params=params, timeout=10)
+        retries = getattr(resp.raw, "retries", None)
+        span.update(status=resp.status_code, bytes=len(resp.content), retries=len(retries.history) if retries else 0)
+        METRICS.inc("universalis_requests_total", status=resp.status_code)
+        METRICS.inc("universalis_response_bytes_total", span["bytes"])
+        METRICS.inc("universalis_retries_total", span["retries"])
+        resp.raise_for_status()
+    time.sleep(0.2)
+    return resp.json()
+
+
+def chunk_ids(item_ids: Iterable[int], size: int = MAX_ITEMS_PER_REQUEST) -> List[List[int]]:
+    """Split item IDs into batches small enough for a single Universalis call."""
+    ids = list(dict.fromkeys(int(id) for id in item_ids))
+    return [ids[i:i + size] for i in range(0, len(ids), size)]
+
+
+def empty_prices() -> pl.DataFrame:
+    return pl.DataFrame(schema=PRICE_SCHEMA)
+
+
+def parse_market_data(data: Dict[str, dict], region: str, hq: bool) -> pl.DataFrame:
+    """Reduce raw Universalis item data to the cheapest listing and sale velocity per item.
+
+    Args:
+        data: Universalis item data keyed by item ID
+        region: Datacentre or world the data was requested for
+        hq: Whether the data holds HQ listings
+
+    Returns:
+        DataFrame with item_id and prefixed price/velocity/world columns
+    """
+    prefix = "hq" if hq else "nq"
+    # Items without listings keep their sale velocity but have no price
+    data = {id: {**item, "listings": item.get("listings") or [{"pricePerUnit": None}]} for id, item in data.items()}
+    if not data:
+        return empty_prices().select("item_id", f"{prefix}_price", f"{prefix}_velocity", f"{prefix}_world")
+
+    # Unpivot and unnest json data
+    df = pl.DataFrame(data).lazy().unpivot(variable_name="id").unnest("value")
+    df = df.explode("listings").unnest("listings")
+    columns = df.collect_schema().names()
+
+    # Filter out Mannquin items (irrelevant listings)
+    if "onMannequin" in columns:
+        df = df.filter(
+            (pl.col("onMannequin") == False) | pl.col("onMannequin").is_null()
+        )
+
+    # Add worldname if missing (for single world queries)
+    if "worldName" not in columns:
+        df = df.with_columns((pl.lit(region)).alias("worldName"))
+    for col in ("pricePerUnit", f"{prefix}SaleVelocity"):
+        if col not in columns:
+            df = df.with_columns(pl.lit(None).alias(col))
+
+    # Find minimum price for each group
+    df = df.group_by("id").min()
+    return df.select(
+        pl.col("id").cast(pl.Int64).alias("item_id"),
+        pl.col("pricePerUnit").cast(pl.Int64).alias(f"{prefix}_price"),
+        pl.col(f"{prefix}SaleVelocity").cast(pl.Float64).round(2).alias(f"{prefix}_velocity"),
+        pl.col("worldName").cast(pl.String).alias(f"{prefix}_world"),
+    ).collect()
+
+
+def fetch_market_prices(session: requests.Session, item_ids: List[int], region: str) -> pl.DataFrame:
+    """GET cheapest NQ/HQ listings for up to MAX_ITEMS_PER_REQUEST items in one region.
+
+    Items Universalis has no data for are still returned, with null prices, so callers
+    can cache the miss.
+
+    Raises:
+        requests.exceptions.RequestException: If Universalis cannot be reached
+    """
+    url = f"{UNIVERSALIS_URL}/{region}/{','.join(str(id) for id in item_ids)}"
+    # Single item lookups return the item itself rather than an "items" mapping
+    single = len(item_ids) == 1
+    fields = MARKET_FIELDS if single else [f"items.{field}" for field in MARKET_FIELDS]
+
+    # GET data from Universalis API twice per item - once each for NQ/HQ
+    frames = []
+    for hq in [False, True]:
+        parameters = {
+            "hq": hq,
+            "listings": 100,
+            "fields": ",".join(fields),
+        }
+        response_json = fetch_universalis(session, url, parameters)
+        data = {str(item_ids[0]): response_json} if single else response_json.get("items", {})
+        frames.append(parse_market_data(data, region, hq))
+
+    # Merge NQ/HQ data together, keeping a row for every requested item
+    requested = pl.DataFrame({"item_id": item_ids}, schema={"item_id": pl.Int64})
+    prices_df = requested.join(frames[0], on="item_id", how="left").join(frames[1], on="item_id", how="left")
+    return prices_df.select(list(PRICE_SCHEMA)).sort("item_id")
+
+
+LISTING_SCHEMA = {
+    "item_id": pl.Int64,
+    "world": pl.String,
+    "hq": pl.Boolean,
+    "price_per_unit": pl.Int64,
+    "quantity": pl.Int64,
+}
+
+
+def fetch_listings(session: requests.Session, item_ids: Iterable[int], region: str, listings: int = 100) -> pl.DataFrame:
+    """GET individual NQ and HQ listings (price, quantity, world) for any number of items.
+
+    Items are requested in chunks of MAX_ITEMS_PER_REQUEST; mannequin listings are dropped.
+    """
+    fields = ["listings.pricePerUnit", "listings.quantity", "listings.worldName", "listings.hq", "listings.onMannequin"]
+    rows = []
+    for batch in chunk_ids(item_ids):
+        single = len(batch) == 1
+        url = f"{UNIVERSALIS_URL}/{region}/{','.join(str(id) for id in batch)}"
+        params = {"listings": listings, "fields": ",".join(fields if single else [f"items.{field}" for field in fields])}
+        response_json = fetch_universalis(session, url, params)
+        data = {str(batch[0]): response_json} if single else response_json.get("items", {})
+        for id, item in data.items():
+            for listing in item.get("listings") or []:
+                if listing.get("onMannequin"):
+                    continue
+                rows.append({
+                    "item_id": int(id),
+                    # Single world queries omit the world name
+                    "world": listing.get("worldName") or region,
+                    "hq": bool(listing.get("hq")),
+                    "price_per_unit": listing.get("pricePerUnit"),
+                    "quantity": listing.get("quantity") or 1,
+                })
+    return pl.DataFrame(rows, schema=LISTING_SCHEMA)
+
+
+class PriceCache:
+    """Process-wide cache of market rows keyed by (region, item_id), shared by every session.
+
+    Entries expire after `ttl` seconds; `expiring` lets a background refresher find entries
+    that are about to expire so they can be renewed before a page needs them. Listeners are
+    called with (region, prices_df) for every batch of freshly fetched rows put in the cache.
+    """
+
+    def __init__(self, ttl: float = PRICE_TTL):
+        self.ttl = ttl
+        self.listeners: List[Callable[[str, pl.DataFrame], None]] = []
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, int], Tuple[float, dict]] = {}
+
+    def get(self, region: str, item_ids: Iterable[int], now: Optional[float] = None) -> Tuple[pl.DataFrame, List[int]]:
+        """Return cached rows that are still fresh, plus the IDs that need fetching."""
+        now = time.time() if now is None else now
+        rows, missing = [], []
+        with self._lock:
+            for id in item_ids:
+                entry = self._entries.get((region.lower(), int(id)))
+                if entry is not None and now - entry[0] < self.ttl:
+                    rows.append(entry[1])
+                else:
+                    missing.append(int(id))
+        METRICS.inc("price_cache_hits_total", len(rows))
+        METRICS.inc("price_cache_misses_total", len(missing))
+        return pl.DataFrame(rows, schema=PRICE_SCHEMA), missing
+
+    def put(self, region: str, prices_df: pl.DataFrame, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        with self._lock:
+            for row in prices_df.select(list(PRICE_SCHEMA)).iter_rows(named=True):
+                self._entries[(region.lower(), row["item_id"])] = (now, row)
+        for listener in self.listeners:
+            listener(region, prices_df)
+
+    def expiring(self, region: str, item_ids: Iterable[int], within: float, now: Optional[float] = None) -> List[int]:
+        """Return IDs that are missing or will expire within `within` seconds."""
+        now = time.time() if now is None else now
+        with self._lock:
+            return [
+                int(id) for id in item_ids
+                if (entry := self._entries.get((region.lower(), int(id)))) is None
+                or now - entry[0] >= self.ttl - within
+            ]
+
+
+def get_market_prices(session: requests.Session, cache: PriceCache, item_ids: Iterable[int], region: str) -> pl.DataFrame:
+    """Return market rows for the given items, only calling Universalis for stale or missing entries."""
+    item_ids = list(dict.fromkeys(int(id) for id in item_ids))
+    cached_df, missing = cache.get(region, item_ids)
+    frames = [cached_df]
+    for batch in chunk_ids(missing):
+        fetched_df = fetch_market_prices(session, batch, region)
+        cache.put(region, fetched_df)
+        frames.append(fetched_df)
+    return pl.concat(frames).unique("item_id", keep="last").sort("item_id")
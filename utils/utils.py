@@ -1,5 +1,7 @@
 import logging
 
+import polars as pl
+
 def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:    
     """Configure and return a logger instance.
     
@@ -17,4 +19,26 @@ def setup_logger(name: str, level: int = logging.INFO) -> logging.Logger:
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
     return logging.getLogger(name)
-    
\ No newline at end of file
+    
+
+def add_selectbox_label(recipes_df: pl.DataFrame) -> pl.DataFrame:
+    """Add the `selectbox_label` column used to pick a recipe in the app.
+
+    Args:
+        recipes_df: Rows of the recipe_price table
+
+    Returns:
+        recipes_df with a "<item name> (<item id>)" label, plus the job for items craftable by two jobs
+    """
+    results_df = recipes_df.filter(pl.col("recipe_part") == "result")
+
+    # Concat item_id to the end of item_name to make selectbox easily searchable
+    # Some items can be crafted by two jobs (ARM/BSM) with slightly different recipes, so appending job name to the end as well
+    two_job_craftable = results_df.filter(pl.col("item_id").is_duplicated())
+
+    return recipes_df.lazy().with_columns(
+        pl.when(pl.col("recipe_id").is_in(two_job_craftable["recipe_id"].implode()))
+        .then(pl.concat_str([pl.col("item_name"), pl.lit(" ("), pl.col("item_id"), pl.lit(")"), pl.lit(" ("), pl.col("job"), pl.lit(")")]))
+        .otherwise(pl.concat_str([pl.col("item_name"), pl.lit(" ("), pl.col("item_id"), pl.lit(")")]))
+        .alias("selectbox_label")
+    ).collect()
@@ -0,0 +1,333 @@
+"""Watchlist rules that alert when a recipe crosses its profit and velocity goals"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import duckdb
+import polars as pl
+import requests
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process only
+    fcntl = None
+
+from utils import utils
+from utils.db import connect_writable
+from utils.planner import build_ingredient_matrix
+from utils.universalis import PriceCache
+
+logger = utils.setup_logger(__name__)
+
+WATCHLIST_DB_NAME = "watchlist.duckdb"  # Writable, unlike the swapped-in price database
+ALERT_LOG = Path(os.getenv("WATCHLIST_ALERT_LOG", "watchlist_alerts.jsonl"))
+WEBHOOK_URL = os.getenv("WATCHLIST_WEBHOOK_URL")
+WATCHLIST_LOCK = "watchlist.lock"  # Held by the one app worker that evaluates rules
+
+# Market fields whose change can move a rule's profit or velocity
+FINGERPRINT_FIELDS = ["nq_price", "nq_velocity", "hq_price", "hq_velocity"]
+
+
+@dataclass
+class WatchRule:
+    rule_id: int
+    recipe_id: int
+    dc: str
+    world: Optional[str]
+    profit_goal: float
+    velocity_goal: float
+    last_state: Optional[bool] = None
+
+
+@dataclass
+class Alert:
+    rule_id: int
+    recipe_id: int
+    item_id: int
+    dc: str
+    world: Optional[str]
+    triggered: bool
+    profit_perc: Optional[float]
+    velocity: Optional[float]
+    evaluated_at: str
+
+
+class WatchlistStore:
+    """Watch rules and their last evaluated state in a small DuckDB file.
+
+    Each operation opens a short-lived connection, so several app worker processes can share
+    the file, taking turns on DuckDB's single-writer lock.
+    """
+
+    def __init__(self, db_path: str = WATCHLIST_DB_NAME):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("CREATE SEQUENCE IF NOT EXISTS watch_rule_id")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS watch_rule (
+                    rule_id INTEGER PRIMARY KEY DEFAULT nextval('watch_rule_id'),
+                    recipe_id INTEGER NOT NULL,
+                    dc VARCHAR NOT NULL,
+                    world VARCHAR,
+                    profit_goal DOUBLE NOT NULL,
+                    velocity_goal DOUBLE NOT NULL,
+                    created_at TIMESTAMPTZ DEFAULT current_timestamp,
+                    last_state BOOLEAN,
+                    last_profit_perc DOUBLE,
+                    last_velocity DOUBLE,
+                    last_evaluated_at TIMESTAMPTZ
+                )""")
+
+    def _connect(self) -> duckdb.DuckDBPyConnection:
+        return connect_writable(self.db_path)
+
+    def add_rule(self, recipe_id: int, dc: str, world: Optional[str], profit_goal: float, velocity_goal: float) -> int:
+        with self._lock, self._connect() as db:
+            return db.execute(
+                "INSERT INTO watch_rule (recipe_id, dc, world, profit_goal, velocity_goal) VALUES (?, ?, ?, ?, ?) RETURNING rule_id",
+                [recipe_id, dc, world or None, profit_goal, velocity_goal],
+            ).fetchone()[0]
+
+    def remove_rule(self, rule_id: int) -> None:
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM watch_rule WHERE rule_id = ?", [rule_id])
+
+    def rules(self) -> List[WatchRule]:
+        with self._lock, self._connect() as db:
+            rows = db.execute("""SELECT rule_id, recipe_id, dc, world, profit_goal, velocity_goal, last_state
+                                 FROM watch_rule ORDER BY rule_id""").fetchall()
+        return [WatchRule(*row) for row in rows]
+
+    def rules_df(self) -> pl.DataFrame:
+        with self._lock, self._connect() as db:
+            return db.sql("SELECT * FROM watch_rule ORDER BY rule_id").pl()
+
+    def record_states(self, alerts: Iterable[Alert]) -> None:
+        rows = [[alert.triggered, alert.profit_perc, alert.velocity, alert.evaluated_at, alert.rule_id] for alert in alerts]
+        if not rows:
+            return
+        with self._lock, self._connect() as db:
+            db.executemany("""UPDATE watch_rule
+                              SET last_state = ?, last_profit_perc = ?, last_velocity = ?, last_evaluated_at = ?
+                              WHERE rule_id = ?""", rows)
+
+
+class OwnerLock:
+    """Non-blocking exclusive lock on a file, held for the life of the process once acquired.
+
+    App workers each run a prefetcher; the worker holding this lock is the only one that
+    evaluates watch rules and sends alerts. The OS releases the lock when its holder exits,
+    so another worker takes over on its next attempt.
+    """
+
+    def __init__(self, path: str = WATCHLIST_LOCK):
+        self.path = path
+        self._file = None
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """True if this process holds the lock, trying to take it if not."""
+        with self._lock:
+            if self._file is not None or fcntl is None:
+                return True
+            f = open(self.path, "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._file = f
+            logger.info(f"This worker now evaluates watch rules (pid {os.getpid()})")
+            return True
+
+
+class FileSink:
+    """Appends alerts as JSON lines to a local file."""
+
+    def __init__(self, path: Path = ALERT_LOG):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    def send(self, alert: Alert) -> None:
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(asdict(alert)) + "\n")
+
+
+class WebhookSink:
+    """POSTs each alert as JSON to a webhook URL; failures are logged and dropped."""
+
+    def __init__(self, url: str, session_factory: Callable[[], requests.Session] = requests.Session):
+        self.url = url
+        self.session_factory = session_factory
+
+    def send(self, alert: Alert) -> None:
+        try:
+            self.session_factory().post(self.url, json=asdict(alert), timeout=10).raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Webhook alert for rule {alert.rule_id} failed: {e}")
+
+
+def default_sinks() -> list:
+    sinks = [FileSink()]
+    if WEBHOOK_URL:
+        sinks.append(WebhookSink(WEBHOOK_URL))
+    return sinks
+
+
+class Watchlist:
+    """Re-evaluates watch rules as fresh market data arrives, alerting when a rule changes state.
+
+    A rule is met when, buying ingredients on its datacentre and selling on its world (or the
+    datacentre), profit % and sale velocity are both above its goals, as in the app's sell
+    recommendation. Prices are fingerprinted per (region, item), so each refresh only
+    re-evaluates rules for recipes using an item whose price or velocity actually changed.
+
+    With an `owner` lock, rules are only loaded, kept warm and evaluated while this process
+    holds it, so several app workers send each alert once.
+    """
+
+    def __init__(self, store: WatchlistStore, all_recipes_df: pl.DataFrame, sinks: Optional[list] = None,
+                 owner: Optional[OwnerLock] = None):
+        self.store = store
+        self.sinks = default_sinks() if sinks is None else sinks
+        self.owner = owner
+        matrix, results = build_ingredient_matrix(all_recipes_df)
+        self.ingredients: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+        for recipe_id, item_id, amount in matrix.iter_rows():
+            self.ingredients[recipe_id].append((item_id, amount))
+        self.result_of = {recipe_id: (result_id, amount) for recipe_id, result_id, amount in results.iter_rows()}
+        self.shop_price: Dict[int, Optional[float]] = dict(
+            all_recipes_df.select("item_id", "shop_price").unique("item_id").iter_rows()
+        )
+        self._fingerprints: Dict[Tuple[str, int], tuple] = {}
+        self._lock = threading.Lock()
+        self._pending: Set[int] = set()  # Rules not evaluated since they were loaded
+        self.rules: List[WatchRule] = []
+        self.reload()
+
+    def is_owner(self) -> bool:
+        return self.owner is None or self.owner.acquire()
+
+    def reload(self) -> None:
+        """Re-read rules from the store and rebuild the item -> rules index (empty unless owner)."""
+        rules = [rule for rule in self.store.rules() if rule.recipe_id in self.result_of] if self.is_owner() else []
+        rules_by_item: Dict[int, List[WatchRule]] = defaultdict(list)
+        for rule in rules:
+            for item_id in self.recipe_items(rule.recipe_id):
+                rules_by_item[item_id].append(rule)
+        with self._lock:
+            known = {rule.rule_id for rule in self.rules}
+            self._pending = {rule.rule_id for rule in rules if rule.rule_id not in known or rule.rule_id in self._pending}
+            self.rules, self.rules_by_item = rules, rules_by_item
+
+    def evaluate_pending(self, cache: PriceCache) -> List[Alert]:
+        """Evaluate rules added since the last reload, without waiting for one of their prices to
+        change; rules whose prices are not all cached yet stay pending."""
+        with self._lock:
+            rules = [rule for rule in self.rules if rule.rule_id in self._pending]
+        return self.evaluate(rules, cache) if rules else []
+
+    def recipe_items(self, recipe_id: int) -> Set[int]:
+        return {item_id for item_id, _ in self.ingredients[recipe_id]} | {self.result_of[recipe_id][0]}
+
+    def requests(self) -> List[Tuple[int, str, Optional[str]]]:
+        """(result item, dc, world) page requests for every rule, for the prefetcher to keep warm."""
+        return [(self.result_of[rule.recipe_id][0], rule.dc, rule.world) for rule in self.rules]
+
+    def changed_items(self, region: str, prices_df: pl.DataFrame) -> Set[int]:
+        """Items whose market fields differ from the last data seen for this region."""
+        changed = set()
+        with self._lock:
+            for row in prices_df.select("item_id", *FINGERPRINT_FIELDS).iter_rows():
+                key = (region.lower(), row[0])
+                if self._fingerprints.get(key) != row[1:]:
+                    self._fingerprints[key] = row[1:]
+                    changed.add(row[0])
+        return changed
+
+    def affected_rules(self, region: str, item_ids: Iterable[int]) -> List[WatchRule]:
+        affected = {}
+        for item_id in item_ids:
+            for rule in self.rules_by_item.get(item_id, ()):
+                if region.lower() in (rule.dc.lower(), (rule.world or "").lower()):
+                    affected[rule.rule_id] = rule
+        return list(affected.values())
+
+    def on_prices(self, region: str, prices_df: pl.DataFrame, cache: PriceCache) -> List[Alert]:
+        """Handle freshly fetched prices for a region: re-evaluate affected rules and send alerts."""
+        if not self.rules:
+            return []
+        rules = self.affected_rules(region, self.changed_items(region, prices_df))
+        return self.evaluate(rules, cache) if rules else []
+
+    def _market_rows(self, cache: PriceCache, region: str, item_ids: Iterable[int]) -> Optional[Dict[int, dict]]:
+        df, missing = cache.get(region, item_ids)
+        if missing:
+            return None
+        return {row["item_id"]: row for row in df.iter_rows(named=True)}
+
+    def evaluate_rule(self, rule: WatchRule, cache: PriceCache) -> Optional[Alert]:
+        """Profit % and velocity of a rule from cached prices; None if prices are not all cached yet."""
+        result_id, result_amount = self.result_of[rule.recipe_id]
+        buy = self._market_rows(cache, rule.dc, [item_id for item_id, _ in self.ingredients[rule.recipe_id]])
+        sell = self._market_rows(cache, rule.world or rule.dc, [result_id])
+        if buy is None or sell is None:
+            return None
+
+        craft_cost = 0.0
+        for item_id, amount in self.ingredients[rule.recipe_id]:
+            prices = [self.shop_price.get(item_id), buy[item_id]["nq_price"], buy[item_id]["hq_price"]]
+            prices = [price for price in prices if price is not None]
+            if not prices:
+                craft_cost = None
+                break
+            craft_cost += amount * min(prices)
+
+        result = sell[result_id]
+        if result["hq_price"] is not None:
+            sell_price, velocity = result["hq_price"], result["hq_velocity"]
+        else:
+            sell_price, velocity = result["nq_price"], result["nq_velocity"]
+        profit_perc = None
+        if craft_cost and sell_price is not None:
+            profit_perc = (sell_price * result_amount - craft_cost) / craft_cost
+
+        triggered = (profit_perc is not None and velocity is not None
+                     and profit_perc > rule.profit_goal and velocity > rule.velocity_goal)
+        return Alert(rule.rule_id, rule.recipe_id, result_id, rule.dc, rule.world, triggered,
+                     profit_perc, velocity, datetime.now(timezone.utc).isoformat())
+
+    def evaluate(self, rules: Iterable[WatchRule], cache: PriceCache) -> List[Alert]:
+        """Evaluate rules, record their state and send alerts for those that crossed their goals.
+
+        A rule alerts when it becomes met, and again when it stops being met; a rule that was
+        never met stays quiet.
+
+        Returns:
+            Alerts sent
+        """
+        evaluated, alerts = [], []
+        for rule in rules:
+            alert = self.evaluate_rule(rule, cache)
+            if alert is None:
+                continue
+            with self._lock:
+                self._pending.discard(rule.rule_id)
+            evaluated.append(alert)
+            if alert.triggered != bool(rule.last_state):
+                alerts.append(alert)
+            rule.last_state = alert.triggered
+        self.store.record_states(evaluated)
+        for alert in alerts:
+            for sink in self.sinks:
+                sink.send(alert)
+        if alerts:
+            logger.info(f"Sent {len(alerts)} watchlist alerts")
+        return alerts